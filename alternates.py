@@ -0,0 +1,136 @@
+"""other valid answers for the game words, grouped by letter signature (the word's letters sorted).
+
+the bot loads other_possible_answers.groups with one read at import: one line per signature holding every
+valid word with those letters, space separated, game words included. only signatures of game words that have
+at least one other valid word are written. rebuild it whenever the word bank csv changes or to accept a bigger
+dictionary:
+
+    python alternates.py words_alpha.txt other_possible_answers --csv word_score_gloss_sorted.csv
+
+the dictionaries are streamed in chunks to a pool of worker processes, so million word lists don't have to fit
+in one process or run on one core. without a groups file the bot falls back to the flat other_possible_answers list.
+"""
+import argparse
+import csv
+import os
+import re
+import time
+from collections import defaultdict
+from itertools import islice
+from typing import Dict
+
+from word_bank import WORD_BANK_CSV
+
+ALTERNATES_PATH = 'other_possible_answers.groups'
+LEGACY_PATH = 'other_possible_answers'
+
+WORD_RE = re.compile(r'^[a-z]+$')
+
+
+def letter_signature(word: str) -> str:
+    return ''.join(sorted(word))
+
+
+def build_signature_index(words) -> Dict[str, frozenset]:
+    """group words by sorted letters so all anagrams of a word are one hash lookup away"""
+    index = defaultdict(set)
+    for word in words:
+        index[letter_signature(word)].add(word)
+    return {signature: frozenset(group) for signature, group in index.items()}
+
+
+def load_signature_index(path: str = ALTERNATES_PATH, legacy_path: str = LEGACY_PATH, csv_path: str = WORD_BANK_CSV) -> Dict[str, frozenset]:
+    """signature -> all valid permutations, from the groups file or the flat legacy list"""
+    if not os.path.exists(path):
+        # set of other possible valid words for same letters as anagram words. other permutations
+        with open(legacy_path, 'r') as f:
+            return build_signature_index(set(f.read().splitlines()))
+    if os.path.exists(csv_path) and os.path.getmtime(csv_path) > os.path.getmtime(path):
+        print(f"{path} is older than {csv_path}, rebuild it with alternates.py")
+    with open(path, 'r') as f:
+        groups = f.read().split('\n')
+    index = {}
+    for line in groups:
+        if line:
+            group = line.split(' ')
+            index[letter_signature(group[0])] = frozenset(group)
+    return index
+
+
+_signatures = None  # game word signatures, set per worker process
+
+
+def _init_worker(signatures):
+    global _signatures
+    _signatures = signatures
+
+
+def _group_chunk(lines) -> Dict[str, set]:
+    groups = defaultdict(set)
+    for line in lines:
+        word = line.strip().lower()
+        if not WORD_RE.match(word):
+            continue
+        signature = letter_signature(word)
+        if signature in _signatures:
+            groups[signature].add(word)
+    return groups
+
+
+def _chunks(paths, chunk_size):
+    for path in paths:
+        with open(path, 'r', errors='ignore') as f:
+            while True:
+                chunk = list(islice(f, chunk_size))
+                if not chunk:
+                    break
+                yield chunk
+
+
+def build_alternates(game_words, dictionaries, out_path: str = ALTERNATES_PATH, workers: int = None, chunk_size: int = 100_000) -> int:
+    """group every dictionary word sharing letters with a game word and write the groups file,
+    returns the number of groups written"""
+    groups = defaultdict(set)
+    for word in game_words:
+        groups[letter_signature(word)].add(word)
+    signatures = frozenset(groups)
+
+    import multiprocessing # only the build needs it, the bot imports this module for load_signature_index
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(signatures,)) as pool:
+        for partial in pool.imap_unordered(_group_chunk, _chunks(dictionaries, chunk_size)):
+            for signature, words in partial.items():
+                groups[signature] |= words
+
+    written = 0
+    tmp_path = out_path + '.tmp'
+    with open(tmp_path, 'w') as out:
+        for signature in sorted(groups):
+            if len(groups[signature]) > 1:
+                out.write(' '.join(sorted(groups[signature])) + '\n')
+                written += 1
+    os.replace(tmp_path, out_path)
+    return written
+
+
+def read_game_words(csv_path: str = WORD_BANK_CSV):
+    with open(csv_path, 'r') as f:
+        return [row['Word'] for row in csv.DictReader(f)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("dictionaries", nargs="+", help="word lists, one word per line")
+    parser.add_argument("--csv", default=WORD_BANK_CSV, help="word bank csv the game words come from")
+    parser.add_argument("--out", default=ALTERNATES_PATH)
+    parser.add_argument("--workers", type=int, default=None, help="worker processes, default one per core")
+    parser.add_argument("--chunk-size", type=int, default=100_000, help="lines per work item")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    game_words = read_game_words(args.csv)
+    written = build_alternates(game_words, args.dictionaries, args.out, args.workers, args.chunk_size)
+    print(f"{written} groups for {len(game_words)} game words into {args.out} in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,16 +3,35 @@ from datetime import datetime, timedelta, timezone
 from typing import List, Dict, Tuple
 import random
 import re
+import json
 import string
-import numpy as np
 import asyncio
-import csv
+import heapq
+from itertools import chain
+from contextlib import asynccontextmanager
+from bisect import bisect_left, insort
 import math
-from collections import defaultdict, Counter, deque
+import time
+from collections import defaultdict, Counter, deque, OrderedDict
+from word_bank import load_word_bank
+from metrics import metrics
+from outbound import OutboundQueue, PRIORITY_HINT
+import scoring
+from alternates import letter_signature, load_signature_index
+from near_miss import bounded_damerau_levenshtein
+from journal import CircuitBreaker, DatabaseUnavailable
 
-# set of other possible valid words for same letters as anagram words. other permutations
-with open("other_possible_answers", 'r') as f:
-    other_possible_words = set(f.read().splitlines())
+
+def load_word_data():
+    """(word bank, signature index), the slow part of startup.
+    blocking file reads, the bot runs it in a thread with asyncio.to_thread"""
+    # precomputed scores from 20k filtered SFW words from wiktionary and Barron GRE. 
+    # computed from components of crpytanalysis letter frequency, scrabble score, brute-force combinations, length of word, and frequency of encountering such word on internet.
+    # reproducible with word_scores.py, which also cuts the levels and compiles the memory mapped word bank (word_bank.py)
+    word_bank = load_word_bank()
+    # signature -> all valid permutations, shared by word_shuffle and check_hints
+    signature_index = load_signature_index()
+    return word_bank, signature_index
 
 def clean_iso_string(iso_string):
     if iso_string is None:
@@ -27,153 +46,583 @@ def clean_iso_string(iso_string):
             iso_string = f'{parts[0]}.{fractional_seconds.ljust(6, "0")}'
     return iso_string
 
-def modified_damerau_levenshtein(word1, word2):
-    len1, len2 = len(word1), len(word2)
-    dp = [[0] * (len2 + 1) for _ in range(len1 + 1)]
-
-    for i in range(len1 + 1):
-        dp[i][0] = i
-    for j in range(len2 + 1):
-        dp[0][j] = j
-
-    for i in range(1, len1 + 1):
-        for j in range(1, len2 + 1):
-            cost = 0 if word1[i-1] == word2[j-1] else 1
-            dp[i][j] = min(
-                dp[i-1][j] + 1,    # Deletion
-                dp[i][j-1] + 1,    # Insertion
-                dp[i-1][j-1] + cost  # Substitution
-            )
-            if i > 1 and j > 1 and word1[i-1] == word2[j-2] and word1[i-2] == word2[j-1]:
-                dp[i][j] = min(dp[i][j], dp[i-2][j-2] + 1)
+def typo_distance(guess: str, word: str) -> Tuple[int, str]:
+    """(distance, edit_letter) of a guess against the answer, distance capped at 2.
+    edit_letter is the answer letter to react with for substitutions and missing letters"""
+    if guess == word:
+        return (0, None)
+    if bounded_damerau_levenshtein(guess, word, 1) > 1:
+        return (2, None)
 
-    distance = dp[len1][len2]
+    # distance is exactly 1, the first mismatch is where the edit happened
+    len1, len2 = len(guess), len(word)
+    i = 0
+    while i < len1 and i < len2 and guess[i] == word[i]:
+        i += 1
+    if len1 == len2:
+        if guess[i+1:] == word[i+1:]:
+            return (1, word[i])
+        return (1, None) # adjacent transposition
+    elif len1 > len2:
+        return (1, None) # extra letter
+    return (1, word[i])
 
-    if distance != 1:
-        return (distance, None)
+def typo_distance_batch(guess: str, words, max_distance: int = 1) -> Tuple[int, str, str]:
+    """check one guess against the answer and its alternates in a single pass, one banded distance check each.
+    returns (distance, edit_letter, matched_word) of the closest word within max_distance, earlier words win ties,
+    or (max_distance + 1, None, None)"""
+    best = (max_distance + 1, None, None)
+    for word in words:
+        # only a word closer than the best so far matters, so the band shrinks as matches come in
+        distance = bounded_damerau_levenshtein(guess, word, best[0] - 1)
+        if distance < best[0]:
+            best = (distance, typo_distance(guess, word)[1] if distance == 1 else None, word)
+            if distance == 0:
+                break
+    return best
 
-    len_diff = len1 - len2
+class UserDataCache:
+    """bounded cache of user rows, least recently used entries and entries older than ttl seconds get evicted"""
+    def __init__(self, max_size=10000, ttl=3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (value, expires_at)
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
 
-    if len1 == len2:
-        transposed = False
-        diff_count = 0
-        i = 0
-        while i < len1:
-            if word1[i] != word2[i]:
-                if i < len1 - 1 and word1[i] == word2[i+1] and word1[i+1] == word2[i]:
-                    transposed = True
-                    diff_count += 1
-                    i += 2
-                else:
-                    diff_count += 1
-                    i += 1
-            else:
-                i += 1
-        if transposed and diff_count == 1:
-            return (1, None)
-        else:
-            for i in range(len1):
-                if word1[i] != word2[i]:
-                    return (1, word2[i])
-    elif len_diff == 1:
-        return (1, None)
-    elif len_diff == -1:
-        for i in range(len2):
-            if i >= len1 or word1[i] != word2[i]:
-                return (1, word2[i])
-        return (1, word2[-1])
-    else:
-        return (2, None)
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return self.peek(key) is not None
+
+    def peek(self, key):
+        """lookup without touching recency or stats"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] < time.monotonic():
+            del self._entries[key]
+            self.stats["expirations"] += 1
+            return None
+        return entry[0]
+
+    def get(self, key):
+        value = self.peek(key)
+        if value is None:
+            self.stats["misses"] += 1
+            return None
+        self._entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return value
+
+    def put(self, key, value):
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+def distinct_permutations(word: str) -> int:
+    count = math.factorial(len(word))
+    for repeats in Counter(word).values():
+        count //= math.factorial(repeats)
+    return count
+
+def multiset_permutations(word: str):
+    """every distinct ordering of word once, in lexicographic order"""
+    letters = sorted(word)
+    while True:
+        yield ''.join(letters)
+        i = len(letters) - 2
+        while i >= 0 and letters[i] >= letters[i+1]:
+            i -= 1
+        if i < 0:
+            return
+        j = len(letters) - 1
+        while letters[j] <= letters[i]:
+            j -= 1
+        letters[i], letters[j] = letters[j], letters[i]
+        letters[i+1:] = reversed(letters[i+1:])
+
+SHUFFLE_MAX_DRAWS = 32 # rejection draws before word_shuffle walks the orderings instead
+
+USER_COLUMNS = "points, acumen_level, last_powerup, powerup_uses"
+LEADERBOARD_PAGE_SIZE = 1000 # postgrest caps every response at max-rows (1000 on supabase), seeds page through
+
+class UserRecord:
+    """cached usersanagrams row. last_powerup is an IST datetime, powerups the charges left from today's ;daily"""
+    __slots__ = ("points", "acumen", "last_powerup", "powerups")
+
+    def __init__(self, points=0, acumen=50, last_powerup=None, powerups=0):
+        self.points = points
+        self.acumen = acumen
+        self.last_powerup = last_powerup
+        self.powerups = powerups
+
+    def row(self, user_id: int, server_id: int) -> dict:
+        return {
+            "user_id": user_id,
+            "server_id": server_id,
+            "points": self.points,
+            "acumen_level": int(self.acumen),
+            "last_powerup": self.last_powerup.isoformat() if self.last_powerup else None,
+            "powerup_uses": self.powerups,
+        }
 
 class AnagramDatabaseHandler:
-    def __init__(self, supabase_client):
+    def __init__(self, supabase_client, write_behind=False, flush_size=50, max_staleness=10.0, cache_size=10000, cache_ttl=3600,
+                 journal=None, breaker=None, call_timeout=None, max_in_flight=4, max_backoff=300.0):
         self.db = supabase_client
         self.ist = timezone(timedelta(hours=5, minutes=30))
-        self._user_data_cache = {}  # user_id, server_id -> (points, acumen_level)
+        self._user_data_cache = UserDataCache(cache_size, cache_ttl)  # user_id, server_id -> UserRecord
+        self.leaderboards = LeaderboardIndex()
+        # write-behind: rows waiting to be upserted, flushed on size or after max_staleness seconds
+        # a journal makes every write local and durable first, so it implies write-behind
+        self.journal = journal  # journal.ScoreJournal
+        self.write_behind = write_behind or journal is not None
+        self.flush_size = flush_size
+        self.max_staleness = max_staleness
+        self.max_in_flight = max_in_flight  # concurrent upsert batches when a flush is bigger than flush_size
+        self.max_backoff = max_backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.call_timeout = call_timeout  # seconds before a db call counts as failed, None waits for the client timeout
+        self._dirty = {}  # user_id, server_id -> UserRecord waiting to be upserted
+        self._flush_lock = asyncio.Lock()
+        self._flush_task = None
+        self._flusher = None
+        self.flush_stats = {
+            "flushes": 0,
+            "rows": 0,
+            "failures": 0,
+            "last_size": 0,
+            "last_latency": 0.0,
+            "max_latency": 0.0,
+        }
+        self._deferred = {}  # user_id, server_id -> points earned while the row couldn't be read
+        if journal is not None:
+            # writes that never reached the db before the last shutdown or crash
+            for row in journal.pending():
+                cache_key = (row['user_id'], row['server_id'])
+                record = self._record_from_row(row)
+                self._dirty[cache_key] = record
+                self._user_data_cache.put(cache_key, record)
+            self._deferred = journal.deferred()
 
-    async def get_user_data(self, user_id: int, server_id: int):
+    async def timed_execute(self, call: str, query):
+        """run a postgrest query through the circuit breaker, recording its latency under the call type when metrics are on"""
+        if not self.breaker.allow():
+            raise DatabaseUnavailable(f"{call} skipped, database circuit is open")
+        start = time.perf_counter() if metrics.enabled else 0
+        try:
+            if self.call_timeout:
+                result = await asyncio.wait_for(query.execute(), self.call_timeout)
+            else:
+                result = await query.execute()
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        finally:
+            if metrics.enabled:
+                metrics.observe("db_call_seconds", time.perf_counter() - start, call=call)
+        self.breaker.record_success()
+        return result
+
+    def _record_from_row(self, row) -> UserRecord:
+        last_powerup = clean_iso_string(row.get('last_powerup'))
+        if last_powerup:
+            last_powerup = datetime.fromisoformat(last_powerup).astimezone(self.ist)
+        fresh = UserRecord() # a just inserted row may have nulls where the table has no default
+        points = row.get('points')
+        acumen = row.get('acumen_level')
+        return UserRecord(fresh.points if points is None else points, fresh.acumen if acumen is None else acumen,
+                          last_powerup, row.get('powerup_uses') or 0)
+
+    def _cached_record(self, cache_key):
+        # unflushed writes are newer than anything the db can have
+        record = self._dirty.get(cache_key)
+        if record is None:
+            record = self._user_data_cache.get(cache_key)
+        return record
+
+    async def get_user_record(self, user_id: int, server_id: int, create: bool = True):
+        """cached row of a player, fetched on a miss. unknown players get a fresh row unless create is False"""
         cache_key = (user_id, server_id)
-        if cache_key in self._user_data_cache:
-                    return self._user_data_cache[cache_key]
-                
-        result = await self.db.from_("usersanagrams").select("points, acumen_level").eq("user_id", user_id).eq("server_id", server_id).execute()
-        if result.data:
-            user_data = result.data[0]
-            points, acumen = user_data['points'], user_data['acumen_level']
-        else:
-            new_user_data = {
-                "user_id": user_id,
-                "server_id": server_id,
-                "points": 0,
-                "acumen_level": 50
-            }
-            await self.db.from_("usersanagrams").insert(new_user_data).execute()
-            points, acumen = 0, 50
-        self._user_data_cache[cache_key] = (points, acumen)
-        return points, acumen
-    async def update_user_data(self, user_id: int, server_id: int, new_points: int, new_acumen_level: int):
+        record = self._cached_record(cache_key)
+        if record is None and not self.write_behind and (create or cache_key in self._deferred):
+            # merging on the key alone inserts an unknown player with the column defaults and leaves a known one
+            # untouched, either way the row comes back, so first contact is one round-trip
+            result = await self.timed_execute("upsert_user", self.db.from_("usersanagrams").upsert({"user_id": user_id, "server_id": server_id}, on_conflict="user_id,server_id"))
+            record = self._record_from_row(result.data[0])
+            self._user_data_cache.put(cache_key, record)
+        elif record is None:
+            result = await self.timed_execute("select_user", self.db.from_("usersanagrams").select(USER_COLUMNS).eq("user_id", user_id).eq("server_id", server_id))
+            if result.data:
+                record = self._record_from_row(result.data[0])
+            elif not create and cache_key not in self._deferred:
+                return None
+            else:
+                record = UserRecord()
+                # the next bulk upsert creates the row, so first contact stays one round-trip
+                self._mark_dirty(cache_key, record)
+            self._user_data_cache.put(cache_key, record)
+        if cache_key in self._deferred:
+            await self._settle_deferred(cache_key, record)
+        return record
+
+    def defer_points(self, user_id: int, server_id: int, points: int):
+        """keep points scored while the player's row couldn't be read, they are added the next time it is"""
         cache_key = (user_id, server_id)
-        
-        update_data = {
-            "points": new_points,
-            "acumen_level": int(new_acumen_level)
-        }
-        if cache_key in self._user_data_cache:
-            self._user_data_cache[cache_key] = (new_points, new_acumen_level)
+        self._deferred[cache_key] = self._deferred.get(cache_key, 0) + points
+        if self.journal is not None:
+            self.journal.defer(user_id, server_id, points)
 
-        await self.db.from_("usersanagrams").update(update_data).eq("user_id", user_id).eq("server_id", server_id).execute()
+    async def _settle_deferred(self, cache_key, record: UserRecord):
+        points = self._deferred.pop(cache_key)
+        record.points += points
+        self.leaderboards.update(cache_key[1], cache_key[0], record.points)
+        if self.write_behind:
+            self._mark_dirty(cache_key, record, settle=True)
+            return
+        try:
+            await self.timed_execute("update_points", self.db.from_("usersanagrams").update({"points": record.points}).eq("user_id", cache_key[0]).eq("server_id", cache_key[1]))
+        except Exception:
+            record.points -= points
+            self._deferred[cache_key] = self._deferred.get(cache_key, 0) + points
+            raise
 
-    async def update_user_data_pts(self, user_id: int, server_id: int, new_points: int):
+    async def get_user_data(self, user_id: int, server_id: int):
+        record = await self.get_user_record(user_id, server_id)
+        return record.points, record.acumen
+
+    async def warm_up(self, server_ids, concurrency=16):
+        """load the top players of every given server into the cache. each server gets an equal share of the cache,
+        at most one page, so big servers can't crowd the small ones out and no response hits max-rows"""
+        server_ids = list(server_ids)
+        if not server_ids:
+            return 0
+        per_server = min(LEADERBOARD_PAGE_SIZE, max(1, self._user_data_cache.max_size // len(server_ids)))
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def warm_server(server_id):
+            async with semaphore:
+                try:
+                    result = await self.timed_execute("warm_up", self.db.from_("usersanagrams").select("user_id, server_id, " + USER_COLUMNS).eq("server_id", server_id).order("points", desc=True).limit(per_server))
+                except Exception as e:
+                    print(f"warming server {server_id} failed: {e}")
+                    return 0
+                for entry in result.data:
+                    cache_key = (entry['user_id'], entry['server_id'])
+                    if cache_key not in self._dirty:
+                        self._user_data_cache.put(cache_key, self._record_from_row(entry))
+                return len(result.data)
+
+        return sum(await asyncio.gather(*(warm_server(server_id) for server_id in server_ids)))
+
+    async def _save_record(self, call: str, user_id: int, server_id: int, record: UserRecord, columns):
         cache_key = (user_id, server_id)
-        
-        update_data = {
-            "points": new_points,
-        }
-        if cache_key in self._user_data_cache:
-            cached_points, cached_acumen = self._user_data_cache[cache_key]
-            self._user_data_cache[cache_key] = (new_points, cached_acumen)
-            
-        await self.db.from_("usersanagrams").update(update_data).eq("user_id", user_id).eq("server_id", server_id).execute()
+        self._user_data_cache.put(cache_key, record)
+        if self.write_behind:
+            self._mark_dirty(cache_key, record)
+            return
+        row = record.row(user_id, server_id)
+        await self.timed_execute(call, self.db.from_("usersanagrams").update({column: row[column] for column in columns}).eq("user_id", user_id).eq("server_id", server_id))
+
+    async def update_user_data(self, user_id: int, server_id: int, new_points: int, new_acumen_level: int):
+        # a cache miss reloads the row so the powerup columns aren't clobbered
+        record = await self.get_user_record(user_id, server_id)
+        record.points = new_points
+        record.acumen = int(new_acumen_level)
+        self.leaderboards.update(server_id, user_id, new_points, int(new_acumen_level))
+        await self._save_record("update_user", user_id, server_id, record, ("points", "acumen_level", "powerup_uses"))
+
+    async def update_user_data_pts(self, user_id: int, server_id: int, new_points: int):
+        self.leaderboards.update(server_id, user_id, new_points)
+        record = await self.get_user_record(user_id, server_id)
+        record.points = new_points
+        await self._save_record("update_points", user_id, server_id, record, ("points",))
+
+    async def claim_daily_powerup(self, user_id: int, server_id: int, uses: int):
+        """start a day's powerup charges. None for players without a row, False if already claimed today (IST)"""
+        record = await self.get_user_record(user_id, server_id, create=False)
+        if record is None:
+            return None
+        now_ist = datetime.now(self.ist)
+        if record.last_powerup and record.last_powerup.date() == now_ist.date():
+            return False
+        record.last_powerup = now_ist
+        record.powerups = uses
+        await self._save_record("update_powerup", user_id, server_id, record, ("last_powerup", "powerup_uses"))
+        return True
+
+    def consume_powerup(self, user_id: int, server_id: int) -> bool:
+        """use one charge if the player has any left. the decrement is persisted with the score write that follows"""
+        record = self._cached_record((user_id, server_id))
+        if record is None or record.powerups <= 0:
+            return False
+        record.powerups -= 1
+        return True
+
+    def _mark_dirty(self, cache_key, record: UserRecord, settle: bool = False):
+        if self.journal is not None:
+            self.journal.record(record.row(*cache_key), settle)
+        self._dirty[cache_key] = record
+        if (len(self._dirty) >= self.flush_size and self.breaker.state != "open"
+                and (self._flush_task is None or self._flush_task.done())):
+            self._flush_task = asyncio.create_task(self._flush_quietly())
+
+    async def _flush_batch(self, batch, semaphore):
+        async with semaphore:
+            # rows and journal positions are taken together, anything journaled later stays pending
+            seqs = self.journal.seqs(key for key, _ in batch) if self.journal is not None else None
+            rows = [record.row(user_id, server_id) for (user_id, server_id), record in batch]
+            await self.timed_execute("flush", self.db.from_("usersanagrams").upsert(rows, on_conflict="user_id,server_id"))
+            if seqs:
+                self.journal.ack(seqs)
+
+    async def flush(self) -> int:
+        """upsert every dirty row in batches of flush_size, max_in_flight at a time.
+        rows of failed batches stay dirty for the next flush"""
+        async with self._flush_lock:
+            if not self._dirty:
+                return 0
+            pending, self._dirty = self._dirty, {}
+            items = list(pending.items())
+            batches = [items[i:i + self.flush_size] for i in range(0, len(items), self.flush_size)]
+            semaphore = asyncio.Semaphore(self.max_in_flight)
+            start = time.perf_counter()
+            results = await asyncio.gather(*(self._flush_batch(batch, semaphore) for batch in batches), return_exceptions=True)
+            failed, error = {}, None
+            for batch, result in zip(batches, results):
+                if isinstance(result, Exception):
+                    failed.update(batch)
+                    error = result
+            written = len(items) - len(failed)
+            if failed:
+                # newer writes that came in during the flush win over the failed batches
+                failed.update(self._dirty)
+                self._dirty = failed
+                self.flush_stats["failures"] += 1
+            if written:
+                latency = time.perf_counter() - start
+                self.flush_stats["flushes"] += 1
+                self.flush_stats["rows"] += written
+                self.flush_stats["last_size"] = written
+                self.flush_stats["last_latency"] = latency
+                self.flush_stats["max_latency"] = max(self.flush_stats["max_latency"], latency)
+            if error is not None:
+                raise error
+            return written
+
+    async def _flush_quietly(self):
+        try:
+            await self.flush()
+        except Exception as e:
+            print(f"write-behind flush failed: {e}")
+
+    async def _flush_loop(self):
+        failures = 0
+        while True:
+            # back off exponentially while the db keeps failing
+            await asyncio.sleep(min(self.max_backoff, self.max_staleness * 2 ** min(failures, 16)))
+            try:
+                await self.flush()
+                failures = 0
+            except Exception as e:
+                failures += 1
+                print(f"write-behind flush failed ({failures} in a row, {len(self._dirty)} rows waiting): {e}")
+
+    def start_write_behind(self):
+        if not self.write_behind:
+            return
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        """stop the background flusher and push whatever is still dirty"""
+        if self._flusher:
+            self._flusher.cancel()
+            self._flusher = None
+        try:
+            await self.flush()
+        except Exception as e:
+            if self.journal is None:
+                print(f"flush on close failed, {len(self._dirty)} score rows are lost: {e}")
+                return
+            print(f"{len(self._dirty)} score rows stay in the journal for the next start: {e}")
+        if self.journal is not None:
+            self.journal.close()
+
+    async def _seed_leaderboard(self, server_id: int):
+        if self.leaderboards.is_seeded(server_id):
+            return
+        rows = []
+        while True:
+            # stable order so pages don't overlap, and step by what came back in case max-rows is below the page size
+            result = await self.timed_execute("seed_leaderboard", self.db.from_("usersanagrams").select("user_id, points, acumen_level")
+                .eq("server_id", server_id).order("points", desc=True).order("user_id").range(len(rows), len(rows) + LEADERBOARD_PAGE_SIZE - 1))
+            if not result.data:
+                break
+            rows.extend((entry['user_id'], entry['points'], entry['acumen_level']) for entry in result.data)
+        # unflushed writes are newer than what the db returned
+        for (user_id, dirty_server_id), record in self._dirty.items():
+            if dirty_server_id == server_id:
+                rows.append((user_id, record.points, record.acumen))
+        self.leaderboards.seed(server_id, rows)
 
     async def get_leaderboard(self, server_id:int):
-        result = await self.db.from_("usersanagrams").select("user_id, points, acumen_level").eq("server_id", server_id).order("points", desc=True).limit(10).execute()       
+        await self._seed_leaderboard(server_id)
         return [
             {
-                "user_id": entry['user_id'],
-                "points": entry['points'],
-                "acumen": entry['acumen_level'],
+                "user_id": user_id,
+                "points": points,
+                "acumen": acumen,
                 "server_rank": idx + 1
             }
-            for idx, entry in enumerate(result.data)
+            for idx, (user_id, points, acumen) in enumerate(self.leaderboards.top(server_id, 10))
         ]
 
+    async def get_rank(self, user_id: int, server_id: int):
+        await self._seed_leaderboard(server_id)
+        return self.leaderboards.rank(server_id, user_id)
+
+class LeaderboardIndex:
+    """per server ranking kept sorted in memory, seeded once from the db and updated on every score write.
+    only the max_servers servers whose leaderboard was asked for most recently are kept, the rest get seeded again"""
+    def __init__(self, max_servers=500):
+        self.max_servers = max_servers
+        self._ranked = OrderedDict()  # server_id -> sorted list of (-points, user_id), least recently asked first
+        self._users = {}  # server_id -> {user_id: (points, acumen)}
+        self.stats = {"seeded": 0, "evictions": 0}
+
+    def is_seeded(self, server_id: int) -> bool:
+        if server_id not in self._ranked:
+            return False
+        self._ranked.move_to_end(server_id)
+        return True
+
+    def seed(self, server_id: int, rows):
+        users = {}
+        for user_id, points, acumen in rows:
+            users[user_id] = (points, acumen)
+        self._users[server_id] = users
+        self._ranked[server_id] = sorted((-points, user_id) for user_id, (points, acumen) in users.items())
+        self._ranked.move_to_end(server_id)
+        self.stats["seeded"] += 1
+        while len(self._ranked) > self.max_servers:
+            evicted, _ = self._ranked.popitem(last=False)
+            del self._users[evicted]
+            self.stats["evictions"] += 1
+
+    def update(self, server_id: int, user_id: int, points: int, acumen=None):
+        """no-op for servers nobody asked the leaderboard of yet, the seed query covers them"""
+        if server_id not in self._ranked:
+            return
+        ranked, users = self._ranked[server_id], self._users[server_id]
+        old = users.get(user_id)
+        if old is not None:
+            old_points, old_acumen = old
+            if acumen is None:
+                acumen = old_acumen
+            idx = bisect_left(ranked, (-old_points, user_id))
+            if idx < len(ranked) and ranked[idx] == (-old_points, user_id):
+                del ranked[idx]
+        elif acumen is None:
+            acumen = 50
+        users[user_id] = (points, acumen)
+        insort(ranked, (-points, user_id))
+
+    def top(self, server_id: int, n: int = 10) -> List[Tuple[int, int, int]]:
+        users = self._users.get(server_id, {})
+        return [(user_id, -neg_points, users[user_id][1]) for neg_points, user_id in self._ranked.get(server_id, [])[:n]]
+
+    def rank(self, server_id: int, user_id: int):
+        users = self._users.get(server_id, {})
+        if user_id not in users:
+            return None
+        points, acumen = users[user_id]
+        ranked = self._ranked[server_id]
+        position = bisect_left(ranked, (-points, user_id)) + 1
+        total = len(ranked)
+        return {
+            "server_rank": position,
+            "total": total,
+            "points": points,
+            "acumen": acumen,
+            "percentile": 100 * (total - position) / total,  # share of players below
+        }
+
 class AcumenQueue:
-    """maintain a queue of active users performances to decide difficulty of next word"""
-    def __init__(self, max_size=20):
-        self.queue = []
+    """maintain a queue of active users performances to decide difficulty of next word.
+    fixed size ring buffer with a running sum and histogram, so inserts, expiry, sampling and stats are O(1)"""
+    HISTOGRAM_SIZE = 256 # acumen is clamped into this many buckets for percentiles
+
+    def __init__(self, max_size=20, max_age=3600):
         self.max_size = max_size
+        self.max_age = max_age
+        self._user_ids = [0] * max_size
+        self._acumens = [0] * max_size
+        self._times = [0.0] * max_size
+        self._head = 0  # slot of the oldest entry
+        self._count = 0
+        self._total = 0
+        self._histogram = [0] * self.HISTOGRAM_SIZE
+
+    def __len__(self):
+        return self._count
+
+    def _bucket(self, acumen: int) -> int:
+        return min(self.HISTOGRAM_SIZE - 1, max(0, int(acumen)))
+
+    def _drop_oldest(self):
+        acumen = self._acumens[self._head]
+        self._total -= acumen
+        self._histogram[self._bucket(acumen)] -= 1
+        self._head = (self._head + 1) % self.max_size
+        self._count -= 1
+
+    def expire(self, now: float = None):
+        """drop entries older than max_age, amortized O(1) since every entry is dropped once"""
+        if now is None:
+            now = time.time()
+        while self._count and now - self._times[self._head] > self.max_age:
+            self._drop_oldest()
         
     def add_user_message(self, user_id: int, acumen: int, message_time: datetime):
-        current_time = datetime.now(timezone.utc)
-        self.queue = [entry for entry in self.queue 
-                     if (current_time - entry['time']).total_seconds() <= 3600]
-        
-        self.queue.append({
-            'user_id': user_id,
-            'acumen': acumen,
-            'time': message_time
-        })
-        
-        if len(self.queue) > self.max_size:
-            self.queue.pop(0)
+        self.expire()
+        if self._count == self.max_size:
+            self._drop_oldest()
+        slot = (self._head + self._count) % self.max_size
+        self._user_ids[slot] = user_id
+        self._acumens[slot] = acumen
+        self._times[slot] = message_time.timestamp()
+        self._count += 1
+        self._total += acumen
+        self._histogram[self._bucket(acumen)] += 1
+
+    def mean(self) -> float:
+        self.expire()
+        return self._total / self._count if self._count else 0.0
+
+    def percentile(self, p: float) -> int:
+        """approximate p-th percentile (0-100) of recent acumen, read off the histogram"""
+        self.expire()
+        if not self._count:
+            return 0
+        rank = max(1, math.ceil(p / 100 * self._count))
+        seen = 0
+        for bucket, count in enumerate(self._histogram):
+            seen += count
+            if seen >= rank:
+                return bucket
+        return self.HISTOGRAM_SIZE - 1
             
     def get_dynamic_acumen(self) -> int:
-        if not self.queue:
+        self.expire()
+        if not self._count:
             return 20  # Default lowest acumen level
         
         # pick random acumen of active users
-        acumen_levels = [entry['acumen'] for entry in self.queue]
-        avg_acumen_rand = random.choice(acumen_levels)
+        avg_acumen_rand = self._acumens[(self._head + random.randrange(self._count)) % self.max_size]
 
         # occasionally bounce up and down in irl
         if random.random() < 0.3:
@@ -183,116 +632,412 @@ class AcumenQueue:
         
         return avg_acumen_rand
     
+class WordPicker:
+    """no-repeat word selection per server and level in O(1) per pick.
+    uniform picks walk a lazily shuffled permutation of the level (sparse fisher-yates, only swapped slots are stored),
+    weighted picks draw from a per level alias table built from Score. a set backed window of the
+    last `horizon` picks of a server rejects repeats across levels and permutation cycles"""
+    def __init__(self, word_bank, horizon=200, weighted=False):
+        self.word_bank = word_bank
+        self.horizon = horizon
+        self.weighted = weighted
+        self._cursors = {}  # (server_id, level) -> [position, {slot: word offset}]
+        self._recent = defaultdict(deque)  # server_id -> word indices in pick order
+        self._recent_set = defaultdict(set)
+        self._alias_tables = {}  # level -> (probabilities, aliases)
+
+    def pick(self, server_id: int, level: int) -> int:
+        start, end = self.word_bank.level_range(level)
+        size = end - start
+        recent = self._recent_set[server_id]
+        word_idx = None
+        if self.weighted:
+            for _ in range(64):
+                word_idx = start + self._alias_draw(level, size)
+                if word_idx not in recent:
+                    break
+            else:
+                word_idx = None
+        if word_idx is None:
+            # only words picked at the tail of the previous cycle can repeat, so this settles in a few steps
+            for _ in range(size):
+                word_idx = start + self._cursor_draw(server_id, level, size)
+                if word_idx not in recent:
+                    break
+        self.remember(server_id, word_idx)
+        return word_idx
+
+    def remember(self, server_id: int, word_idx: int):
+        recent, recent_set = self._recent[server_id], self._recent_set[server_id]
+        recent.append(word_idx)
+        recent_set.add(word_idx)
+        while len(recent) > self.horizon:
+            recent_set.discard(recent.popleft())
+
+    def recently_chosen(self, server_id: int) -> List[int]:
+        return list(self._recent.get(server_id, ()))
+
+    def forget(self, server_id: int):
+        """drop a server's cursors and history, remember() the history again to reload it"""
+        for level in range(1, 6):
+            self._cursors.pop((server_id, level), None)
+        self._recent.pop(server_id, None)
+        self._recent_set.pop(server_id, None)
+
+    def _cursor_draw(self, server_id: int, level: int, size: int) -> int:
+        cursor = self._cursors.get((server_id, level))
+        if cursor is None:
+            cursor = self._cursors[(server_id, level)] = [0, {}]
+        position, swaps = cursor
+        slot = random.randrange(position, size)
+        chosen = swaps.get(slot, slot)
+        swaps[slot] = swaps.pop(position, position)
+        position += 1
+        if position == size:
+            # cycle finished, start a fresh permutation
+            position = 0
+            swaps.clear()
+        cursor[0] = position
+        return chosen
+
+    def _alias_draw(self, level: int, size: int) -> int:
+        table = self._alias_tables.get(level)
+        if table is None:
+            table = self._alias_tables[level] = self._build_alias_table(level)
+        probabilities, aliases = table
+        slot = random.randrange(size)
+        return slot if random.random() < probabilities[slot] else aliases[slot]
+
+    def _build_alias_table(self, level: int):
+        """vose alias method over the Score of every word in the level"""
+        start, end = self.word_bank.level_range(level)
+        size = end - start
+        weights = [max(self.word_bank.score(idx), 0) for idx in range(start, end)]
+        total = sum(weights) or size
+        if not any(weights):
+            weights = [1] * size
+        scaled = [weight * size / total for weight in weights]
+        probabilities, aliases = [1.0] * size, list(range(size))
+        small = [slot for slot, p in enumerate(scaled) if p < 1]
+        large = [slot for slot, p in enumerate(scaled) if p >= 1]
+        while small and large:
+            low, high = small.pop(), large.pop()
+            probabilities[low] = scaled[low]
+            aliases[low] = high
+            scaled[high] -= 1 - scaled[low]
+            (small if scaled[high] < 1 else large).append(high)
+        return probabilities, aliases
+
+class GuessFilter:
+    """immutable snapshot of a live word, enough to tell without the state lock that a message
+    can't be the answer, an alternate or a distance 1 typo of either"""
+    __slots__ = ("length", "letters", "alternates")
+
+    def __init__(self, word: str, alternates: frozenset):
+        self.length = len(word)
+        self.letters = Counter(word)
+        self.alternates = alternates
+
+    def could_match(self, guess: str) -> bool:
+        if abs(len(guess) - self.length) > 1:
+            return False
+        if guess in self.alternates:
+            return True
+        # one edit changes the letter counts by at most 2 (substitution), transpositions keep them.
+        # alternates have the same letters as the answer so this covers their near misses too
+        diff = Counter(guess)
+        diff.subtract(self.letters)
+        return sum(abs(count) for count in diff.values()) <= 2
+
+class GameState:
+    """one word of a server, from build_game until the next word replaces it"""
+    __slots__ = ("word", "word_idx", "anagram", "base_points", "first_hint", "second_hint", "is_bomb",
+                 "start_time", "hints_sent", "cooldown_adjusted", "alternates", "other_answers")
+
+    def __init__(self, word, word_idx, anagram, base_points, first_hint, second_hint, is_bomb, alternates):
+        self.word = word
+        self.word_idx = word_idx  # the gloss stays in the word bank until a timeout or definition hint needs it
+        self.anagram = anagram
+        self.base_points = base_points
+        self.first_hint = first_hint
+        self.second_hint = second_hint  # None when the second hint is the definition
+        self.is_bomb = is_bomb
+        self.start_time = datetime.now()
+        self.hints_sent = 0  # bit per hint type
+        self.cooldown_adjusted = False
+        self.alternates = alternates
+        self.other_answers = set()  # alternates somebody already found
+
+    def hint_text(self, hint_type: int) -> str:
+        return self.first_hint if hint_type == 1 else self.second_hint
+
+    def hint_sent(self, hint_type: int) -> bool:
+        return bool(self.hints_sent & (1 << hint_type))
+
+    def mark_hint_sent(self, hint_type: int):
+        self.hints_sent |= 1 << hint_type
+
+    def to_dict(self) -> dict:
+        """json-able form for checkpoints, alternates are looked up again on load"""
+        return {
+            "word": self.word,
+            "idx": self.word_idx,
+            "anagram": self.anagram,
+            "base_points": self.base_points,
+            "first_hint": self.first_hint,
+            "second_hint": self.second_hint,
+            "is_bomb": self.is_bomb,
+            "start_time": self.start_time.timestamp(),
+            "hint1_sent": self.hint_sent(1),
+            "hint2_sent": self.hint_sent(2),
+            "cooldown_adjusted": self.cooldown_adjusted,
+            "other_answers": sorted(self.other_answers),
+        }
+
+    @classmethod
+    def from_dict(cls, game: dict, alternates: frozenset) -> 'GameState':
+        game_state = cls(game["word"], game["idx"], game["anagram"], game["base_points"], game["first_hint"],
+                         game["second_hint"], game["is_bomb"], alternates)
+        game_state.start_time = datetime.fromtimestamp(game["start_time"])
+        for hint_type in (1, 2):
+            if game.get(f"hint{hint_type}_sent"):
+                game_state.mark_hint_sent(hint_type)
+        game_state.cooldown_adjusted = game.get("cooldown_adjusted", False)
+        game_state.other_answers = set(game["other_answers"])
+        return game_state
+
+class ServerState:
+    """everything the game keeps for one server"""
+    __slots__ = ("game", "guess_filter", "lock", "streak", "recent_answers", "acumen_queue", "consecutive_misses",
+                 "cooldown_time", "last_active")
+
+    def __init__(self):
+        self.game = None  # live GameState, None between words
+        self.guess_filter = None  # GuessFilter of the live word, swapped whole and read without the lock
+        self.lock = asyncio.Lock()
+        self.streak = [0, 0]  # [user_id, current streak]
+        self.recent_answers = []  # [(user_id, time)] of the current word's correct answers
+        self.acumen_queue = None  # AcumenQueue, created on the first answer
+        self.consecutive_misses = 0
+        self.cooldown_time = 100
+        self.last_active = time.monotonic()  # last player message
+
+class ServerStates:
+    """server_id -> ServerState. servers nobody played in for max_idle seconds are exported to a compact
+    string and dropped between two words, the next get() loads them back"""
+    def __init__(self, export, restore, max_idle=2 * 3600):
+        self.export = export  # callable(server_id) -> json-able dict
+        self.restore = restore  # callable(server_id, dict), fills the freshly created ServerState
+        self.max_idle = max_idle
+        self._servers = {}
+        self._evicted = {}  # server_id -> json of the exported state
+        self.stats = {"evicted": 0, "reloaded": 0}
+
+    def __len__(self):
+        return len(self._servers)
+
+    def __contains__(self, server_id):
+        return server_id in self._servers
+
+    def __iter__(self):
+        return iter(list(self._servers))
+
+    def peek(self, server_id: int):
+        """loaded state or None, never creates or reloads"""
+        return self._servers.get(server_id)
+
+    def get(self, server_id: int, touch: bool = False) -> ServerState:
+        server = self._servers.get(server_id)
+        if server is None:
+            server = self._servers[server_id] = ServerState()
+            evicted = self._evicted.pop(server_id, None)
+            if evicted is not None:
+                self.stats["reloaded"] += 1
+                self.restore(server_id, json.loads(evicted))
+        if touch:
+            server.last_active = time.monotonic()
+        return server
+
+    def discard(self, server_id: int):
+        self._servers.pop(server_id, None)
+        self._evicted.pop(server_id, None)
+
+    def evict_idle(self, now: float = None) -> List[int]:
+        """evict servers idle longer than max_idle that aren't in the middle of something, returns their ids"""
+        now = time.monotonic() if now is None else now
+        evicted = []
+        for server_id, server in list(self._servers.items()):
+            # no live word means a new one is on its way, publishing it would load the server right back
+            if now - server.last_active < self.max_idle or server.lock.locked() or server.game is None:
+                continue
+            self._evicted[server_id] = json.dumps(self.export(server_id), separators=(',', ':'))
+            del self._servers[server_id]
+            evicted.append(server_id)
+        self.stats["evicted"] += len(evicted)
+        return evicted
+
 class AnagramGame:
-    def __init__(self, db_handler):
+    def __init__(self, db_handler, word_data=None):
         self.db_handler = db_handler
-        self.game_state = defaultdict(dict)  # server_id -> game state
-        self.consecutive_misses = defaultdict(int)  # server_id -> miss count
-        self.cooldown_times = defaultdict(lambda: 100)  # server_id -> cooldown time
-        self.powerups = defaultdict(int)  # (user_id, server_id) -> remaining powerup uses
-        self.streaks = defaultdict(lambda: [0, 0])  # (server_id) -> [user_id, current streak]
-        self.acumen_queues = defaultdict(AcumenQueue)
-        self.recent_answers = defaultdict(list) # server_id -> [(user_id, time)]
-        self.recently_chosen_queue = defaultdict(lambda: deque(maxlen=200)) # server_id -> deque of recently chosen words
-        LEVEL_BOUNDARIES = [0, 1025, 5924, 14915, 19100] # inferred based on score plot
-        self.state_locks = defaultdict(asyncio.Lock)
-        self.hint_locks = defaultdict(asyncio.Lock)
+        self.servers = ServerStates(self.export_idle_server, self.reload_server)  # server_id -> ServerState
         self.LOCK_TIMEOUT = 2
-        # precomputed scores from 20k filtered SFW words from wiktionary and Barron GRE. 
-        # computed from components of crpytanalysis letter frequency, scrabble score, brute-force combinations, length of word, and frequency of encountering such word on internet.
-        with open('word_score_gloss_sorted.csv', 'r') as file:
-            reader = csv.DictReader(file)
-            self.words_levels = {
-                1: [],
-                2: [],
-                3: [],
-                4: [],
-                5: []
-            }
-            for idx, row in enumerate(reader):
-                word_info = (row['Word'], int(row['Score']), row['Gloss'])
-                if idx < LEVEL_BOUNDARIES[1]:
-                    self.words_levels[1].append(word_info)
-                elif idx < LEVEL_BOUNDARIES[2]:
-                    self.words_levels[2].append(word_info)
-                elif idx < LEVEL_BOUNDARIES[3]:
-                    self.words_levels[3].append(word_info)
-                elif idx < LEVEL_BOUNDARIES[4]:
-                    self.words_levels[4].append(word_info)
-                else:
-                    self.words_levels[5].append(word_info)
+        self.on_new_game = None  # callback(server_id, game_state) whenever a new word goes live
+        self.on_state_change = None  # callback(server_id) after anything worth checkpointing changed
+        self.on_reload = None  # callback(server_id) when an evicted server is loaded back without a word
+        self.on_word_picked = None  # callback(server_id, word_idx) for every word added to the no-repeat history
+        self.outbox = OutboundQueue()  # all channel sends go through here, never awaited under a server's state lock
+        self.filter_stats = {"passed": 0, "dropped": 0}
+        self.scoring_params = scoring.DEFAULT_PARAMS
+        self.event_log = None  # scoring.GuessEventLog, every scored guess gets appended when set
+        # word_data from load_word_data(), loaded here when not given
+        self.word_bank, self.signature_index = word_data or load_word_data()
+        self.word_picker = WordPicker(self.word_bank, horizon=200) # no repeats within the last 200 words of a server
     
+    def current_game(self, server_id: int):
+        """live GameState of a loaded server, None between words or for evicted servers"""
+        server = self.servers.peek(server_id)
+        return server.game if server else None
+
+    def evict_idle(self) -> List[int]:
+        """drop the state of servers nobody played in for a while, returns their ids"""
+        evicted = self.servers.evict_idle()
+        for server_id in evicted:
+            self.word_picker.forget(server_id)
+        return evicted
+
     async def acquire_lock(self, server_id: int) -> bool:
+        start = time.perf_counter() if metrics.enabled else 0
         try:
-            await asyncio.wait_for(self.state_locks[server_id].acquire(), 
+            await asyncio.wait_for(self.servers.get(server_id).lock.acquire(), 
                                  timeout=self.LOCK_TIMEOUT)
+            if metrics.enabled:
+                metrics.observe("lock_wait_seconds", time.perf_counter() - start, server=server_id)
             return True
         except asyncio.TimeoutError:
+            if metrics.enabled:
+                metrics.incr("lock_timeouts_total", server=server_id)
             return False
+
+    @asynccontextmanager
+    async def locked(self, server_id: int):
+        """async with on the server's state lock, timing wait and hold when metrics are on"""
+        lock = self.servers.get(server_id).lock
+        if not metrics.enabled:
+            async with lock:
+                yield
+            return
+        start = time.perf_counter()
+        await lock.acquire()
+        acquired = time.perf_counter()
+        metrics.observe("lock_wait_seconds", acquired - start, server=server_id)
+        try:
+            yield
+        finally:
+            lock.release()
+            metrics.observe("lock_hold_seconds", time.perf_counter() - acquired, server=server_id)
     async def transition_to_new_game(self, server_id: int, channel, time_to_sleep=0, timeout = False):
+        deadline = time.monotonic() + time_to_sleep
         try:
-            async with self.state_locks[server_id]:
-                old_state = self.game_state.get(server_id, {})
-                self.game_state[server_id] = {}
+            async with self.locked(server_id):
+                server = self.servers.get(server_id)
+                old_state = server.game
+                server.game = None
+                server.guess_filter = None
+            if self.on_state_change:
+                self.on_state_change(server_id)
         except Exception as e:
             print(e)            
+        # prefetch the next word while the cooldown runs, at the deadline it is just a swap and a send
+        new_game = self.build_game(server_id)
+        embed = self.build_game_embed(new_game)
         if time_to_sleep > 0 and timeout:
-            await channel.send(f"⌛ Time's up! The word was **[{old_state['word']}](https://en.wiktionary.org/wiki/{old_state['word']})**: {old_state['def']}\nNext word in {time_to_sleep} seconds\n---")
-            await asyncio.sleep(time_to_sleep)
-        elif time_to_sleep > 0:
-            await asyncio.sleep(time_to_sleep)
+            self.outbox.send(channel, f"⌛ Time's up! The word was **[{old_state.word}](https://en.wiktionary.org/wiki/{old_state.word})**: {self.word_bank.gloss(old_state.word_idx)}\nNext word in {time_to_sleep} seconds\n---", kind="timeout")
+        remaining = deadline - time.monotonic()
+        if remaining > 0:
+            await asyncio.sleep(remaining)
             
-        async with self.state_locks[server_id]:
-            new_game = await self.generate_anagram(server_id)
-            self.game_state[server_id] = new_game
-
-            embed = discord.Embed(
-                description=f"new anagram",
-                title=new_game['anagram'],
-                color=discord.Color.blue()
-            )
-            embed.set_footer(text="💣💣💣" if new_game["is_bomb"] else "")
-        await channel.send(embed=embed)
+        async with self.locked(server_id):
+            self.publish_game(server_id, new_game)
+        self.outbox.send(channel, embed=embed, kind="new_word")
         # await channel.send(f"### New anagram:\n{new_game['anagram']}\n" + 
                             # ("💣💣💣" if new_game["is_bomb"] else "---"))
         return new_game
+
+    def build_game_embed(self, game_state) -> discord.Embed:
+        embed = discord.Embed(
+            description=f"new anagram",
+            title=game_state.anagram,
+            color=discord.Color.blue()
+        )
+        embed.set_footer(text="💣💣💣" if game_state.is_bomb else "")
+        return embed
     
     async def send_hint(self, server_id: int, channel,  hint_type: int):
-        async with self.state_locks[server_id]:
-            game_state = self.game_state.get(server_id)
+        async with self.locked(server_id):
+            game_state = self.servers.get(server_id).game
             if not game_state:
                 return
-            hint_key = f"hint{hint_type}_sent"
-            hint_text_key = f"{'first' if hint_type == 1 else 'second'}_hint"
-            text = game_state[hint_text_key]
-            hint_len = len(game_state.get(hint_text_key, ""))
-            if game_state["second_hint"] != game_state["def"]:
-                footer_text = "first letter hint" if hint_type == 1 else "last letter hint"
-            else:
+            text = game_state.hint_text(hint_type)
+            footer_text = "first letter hint" if hint_type == 1 else "last letter hint"
+            if text is None:
+                text = self.word_bank.gloss(game_state.word_idx)
                 footer_text = "definition"
             embed = discord.Embed(
                 # description=f"hint {hint_type}",
                 description=f"{text}",
-                title=game_state['anagram'],
+                title=game_state.anagram,
                 color=discord.Color.red()
             )
             embed.set_footer(text=footer_text)
 
-            if not game_state.get(hint_key) and game_state.get(hint_text_key):
-                await channel.send(embed=embed)
-                # await channel.send(f"### Hint {hint_type}: \n{game_state[hint_text_key]}\n---")
-                game_state[hint_key] = True  # Mark hint as sent
+            if not game_state.hint_sent(hint_type) and text:
+                self.outbox.send(channel, embed=embed, priority=PRIORITY_HINT, kind="hint")
+                # await channel.send(f"### Hint {hint_type}: \n{text}\n---")
+                game_state.mark_hint_sent(hint_type)
 
 
-    def get_user_key(self, user_id: int, server_id: int) -> tuple:
-        return (user_id, server_id)
-    
-    def word_shuffle(self, word: str) -> str:
+    def could_be_answer(self, server_id: int, guess: str) -> bool:
+        """lock-free pre-check before check_guess, drops chatter that can't score or get a typo hint"""
+        guess_filter = self.servers.get(server_id, touch=True).guess_filter
+        if guess_filter and guess_filter.could_match(guess.lower()):
+            self.filter_stats["passed"] += 1
+            return True
+        self.filter_stats["dropped"] += 1
+        return False
+
+    def get_alternates(self, word: str) -> frozenset:
+        """other valid anagrams of word, excluding word itself"""
+        alternates = self.signature_index.get(letter_signature(word))
+        if not alternates:
+            return frozenset()
+        return alternates - {word}
+
+    def word_shuffle(self, word: str, alternates: frozenset = None) -> str:
+        """random ordering of word that is neither the answer nor another valid anagram.
+        raises ValueError when every ordering gives the answer away"""
+        if alternates is None:
+            alternates = self.get_alternates(word)
+        forbidden = alternates | {word} #make sure we dont reveal answer :P
+        if distinct_permutations(word) <= len(forbidden):
+            raise ValueError(f"no shuffle of {word!r} hides the answer")
+
+        # almost always the first draw is fine, shuffles are uniform over the distinct orderings
         letters = list(word)
-        while ''.join(letters) == word or ''.join(letters) in other_possible_words: #make sure we dont reveal answer :P
+        for _ in range(SHUFFLE_MAX_DRAWS):
             random.shuffle(letters)
+            anagram = ''.join(letters)
+            if anagram not in forbidden:
+                return anagram
 
-        return ''.join(letters)
+        # only a word whose orderings are nearly all forbidden gets here, those have few orderings to walk.
+        # a random rank among the allowed ones keeps it uniform
+        rank = random.randrange(distinct_permutations(word) - len(forbidden))
+        for anagram in multiset_permutations(word):
+            if anagram in forbidden:
+                continue
+            if not rank:
+                return anagram
+            rank -= 1
 
     def generate_hints(self, word: str, anagram: str) -> Tuple[str, str]:
         # keep one letter in correct position
@@ -311,149 +1056,220 @@ class AnagramGame:
         return first_hint, second_hint        
 
     async def generate_anagram(self, server_id: int):
-        # acumen_level = self.acumen_queues[server_id].get_dynamic_acumen()
-        acumen_level = int(random.gauss(40, 30)) #center around 40 acumen
+        game_state = self.build_game(server_id)
+        self.publish_game(server_id, game_state)
+        return game_state
+
+    def publish_game(self, server_id: int, game_state: GameState):
+        """make a built game the live one, the clock starts now"""
+        game_state.start_time = datetime.now()
+        server = self.servers.get(server_id)
+        server.game = game_state
+        server.guess_filter = GuessFilter(game_state.word, game_state.alternates)
+        if self.on_new_game:
+            self.on_new_game(server_id, game_state)
+        if self.on_state_change:
+            self.on_state_change(server_id)
+
+    def resume_game(self, server_id: int, game_state: GameState):
+        """put back a game restored from a checkpoint, keeping its original start time"""
+        server = self.servers.get(server_id)
+        server.game = game_state
+        server.guess_filter = GuessFilter(game_state.word, game_state.alternates)
+        if self.on_new_game:
+            self.on_new_game(server_id, game_state)
+
+    def export_server(self, server_id: int, history: bool = True) -> dict:
+        """compact json-able state of one server for checkpoints, history=False leaves out the no-repeat list
+        for callers that follow it through on_word_picked"""
+        server = self.servers.get(server_id)
+        state = {
+            "game": server.game.to_dict() if server.game else None,
+            "streak": list(server.streak),
+            "cooldown_time": server.cooldown_time,
+        }
+        if history:
+            state["recent_words"] = self.word_picker.recently_chosen(server_id)
+        return state
+
+    def export_idle_server(self, server_id: int) -> dict:
+        """export for eviction, the word is hours old by the time anyone comes back so it's left out"""
+        state = self.export_server(server_id)
+        state["game"] = None
+        return state
+
+    def reload_server(self, server_id: int, state: dict):
+        self.restore_server(server_id, state)
+        if self.on_reload:
+            self.on_reload(server_id)
+
+    def restore_server(self, server_id: int, state: dict) -> bool:
+        """load a checkpointed server, returns whether a live game was resumed"""
+        server = self.servers.get(server_id)
+        if state.get("streak"):
+            server.streak = state["streak"]
+        if state.get("cooldown_time") is not None:
+            server.cooldown_time = state["cooldown_time"]
+        for word_idx in state.get("recent_words", []):
+            self.word_picker.remember(server_id, word_idx)
+        game = state.get("game")
+        # games checkpointed before the word index was stored, or from a different word bank, just get a new word
+        idx = game.get("idx") if game else None
+        if idx is None or idx >= len(self.word_bank) or self.word_bank.word(idx) != game["word"]:
+            return False
+        self.resume_game(server_id, GameState.from_dict(game, self.get_alternates(game["word"])))
+        return True
+
+    def build_game(self, server_id: int):
+        """pick, shuffle and hint the next word without making it live"""
+        acumen_queue = self.servers.get(server_id).acumen_queue
+        if acumen_queue:
+            acumen_level = acumen_queue.get_dynamic_acumen()
+        else:
+            acumen_level = int(random.gauss(40, 30)) #center around 40 acumen until someone answers
         
         word_level = min(5, max(1, int(acumen_level/20)))
         
-        word_info = random.choice(self.words_levels[word_level])
-        word, base_points, definition = word_info
-        
-        while word in self.recently_chosen_queue[server_id]:
-            word_info = random.choice(self.words_levels[word_level])
-            word, base_points, definition = word_info
-        self.recently_chosen_queue[server_id].append(word)
+        for _ in range(10):
+            word_idx = self.word_picker.pick(server_id, word_level)
+            if self.on_word_picked:
+                self.on_word_picked(server_id, word_idx)
+            word = self.word_bank.word(word_idx)
+            alternates = self.get_alternates(word)
+            try:
+                anagram = self.word_shuffle(word, alternates)
+                break
+            except ValueError:
+                continue # e.g. "aaa" or a two letter word whose swap is also a word
+        else:
+            raise ValueError(f"could not find a shufflable word in level {word_level}")
+        base_points = self.word_bank.score(word_idx)
 
-        anagram = self.word_shuffle(word)
         is_bomb = random.randint(1, 100) == 1
         first_hint, second_hint = self.generate_hints(word, anagram)
         if word_level == 5:
-            second_hint = definition # for hardest words,the hint is definitions
-        game_state = {
-            "word": word,
-            "anagram": anagram,
-            "base_points": base_points, 
-            "first_hint": first_hint,
-            "second_hint": second_hint,
-            "def": definition,
-            "is_bomb": is_bomb,
-            "start_time": datetime.now(),
-            "hint1_sent": False,
-            "hint2_sent": False, 
-            "cooldown_adjusted": False,
-            "other_answers": set()
-        }
-        self.game_state[server_id] = game_state
-        return game_state
+            second_hint = None # for hardest words,the hint is definitions
+        return GameState(word, word_idx, anagram, base_points, first_hint, second_hint, is_bomb, alternates)
     
     def check_hints(self, guess, word, server_id):
-        if (sorted(word) == sorted(guess) and guess in other_possible_words) and guess not in self.game_state[server_id]["other_answers"]:
-            self.game_state[server_id]["other_answers"].add(guess)
+        game_state = self.servers.get(server_id).game
+        if guess in game_state.alternates and guess not in game_state.other_answers:
+            game_state.other_answers.add(guess)
             return True, "You got 20 points for finding anagram but not exact answer. Think again"
-        elif guess in self.game_state[server_id]["other_answers"]:
+        elif guess in game_state.other_answers:
             return False, "Someone already guessed this non-anagram word"
-        distance, edit_letter = modified_damerau_levenshtein(guess, word)
-        if distance >1 : 
-            return False, None
-        elif edit_letter:
-            return False, edit_letter # to react easily for missing letter typos
-        return False, "Please check typos"
+        # only the answer and alternates nobody found yet get a hint, answer first so it wins ties
+        targets = chain((word,), (alternate for alternate in game_state.alternates if alternate not in game_state.other_answers))
+        distance, edit_letter, near = typo_distance_batch(guess, targets)
+        if near == word:
+            if edit_letter:
+                return False, edit_letter # to react easily for missing letter typos
+            return False, "Please check typos"
+        if near:
+            return False, "That's a typo away from another valid anagram"
+        return False, None
 
     async def check_guess(self, user_id: int, server_id: int, guess: str, guess_time: float):
-        user_key = self.get_user_key(user_id, server_id)
-        async with self.state_locks[server_id]:
-            game_state = self.game_state[server_id]
-            if not game_state or 'word' not in game_state: return
+        async with self.locked(server_id):
+            server = self.servers.get(server_id, touch=True)
+            game_state = server.game
+            if not game_state: return
             has_capital = guess[0].isupper() if guess else False
             guess = guess.lower()
-            correct = game_state["word"] == guess
-            user_having_streak = self.streaks[server_id]
-            daily_multiplier = 1
+            correct = game_state.word == guess
+            user_having_streak = server.streak
+            params = self.scoring_params
+            elapsed_time = guess_time - game_state.start_time.timestamp()
             
             if correct:
-                cached_recent_answers = self.recent_answers[server_id]
+                cached_recent_answers = server.recent_answers
                 if cached_recent_answers and guess_time - cached_recent_answers[0][1] > 1.5:
                     cached_recent_answers = [
                         ans for ans in cached_recent_answers
                         if guess_time - ans[1] <= 1.5
                     ]
-                    self.recent_answers[server_id] = cached_recent_answers
-
-                multiplier_answer_not_first = 1
-                self.recent_answers[server_id].append((user_id, guess_time))
-                # handle users whose network maybe slow and users who could be on mobile (dont cheat) with exact timestamps
-                buffer_time = 0.1*len(guess)-0.1*len(guess)*len(guess)//10
-                if len(self.recent_answers[server_id]) == 1:
-                    multiplier_answer_not_first = 1
-                elif has_capital and guess_time - self.recent_answers[server_id][0][1] <= buffer_time+0.3:
-                    multiplier_answer_not_first = 0.5
-                elif guess_time - self.recent_answers[server_id][0][1] <= buffer_time:
-                    multiplier_answer_not_first =  0.5
-                else:
+                    server.recent_answers = cached_recent_answers
+
+                server.recent_answers.append((user_id, guess_time))
+                is_first = len(server.recent_answers) == 1
+                gap = guess_time - server.recent_answers[0][1]
+                multiplier_answer_not_first = scoring.answer_multiplier(gap, is_first, has_capital, len(guess), params)
+                if not multiplier_answer_not_first:
+                    # acumen is not looked up for answers that came too late, logged as -1
+                    self.log_guess(guess_time, server_id, user_id, game_state, elapsed_time, gap, 1, -1, 0, len(guess),
+                                   scoring.FLAG_CORRECT | scoring.FLAG_CAPITAL * has_capital)
                     return
                 
             if not correct:
-                partial_correct, hint = self.check_hints(guess, game_state["word"], server_id)
+                partial_correct, hint = self.check_hints(guess, game_state.word, server_id)
                 if partial_correct:
-                    points, acumen = await self.db_handler.get_user_data(user_id, server_id)
-                    points += 20
-                    await self.db_handler.update_user_data_pts(user_id, server_id, points)
-                    return 20, hint
+                    try:
+                        points, acumen = await self.db_handler.get_user_data(user_id, server_id)
+                    except DatabaseUnavailable:
+                        # the row can't be read while the circuit is open, the points are added once it can
+                        self.db_handler.defer_points(user_id, server_id, params.partial_points)
+                        acumen = -1
+                    else:
+                        await self.db_handler.update_user_data_pts(user_id, server_id, points + params.partial_points)
+                    self.log_guess(guess_time, server_id, user_id, game_state, elapsed_time, 0, 0, acumen,
+                                   params.partial_points, len(guess), scoring.FLAG_PARTIAL)
+                    if self.on_state_change:
+                        self.on_state_change(server_id)
+                    return params.partial_points, hint
                 elif hint:
                     return 0, hint 
                 else:
                     return 0, None
                 
             else:
-                points, acumen = await self.db_handler.get_user_data(user_id, server_id)
+                try:
+                    points, acumen = await self.db_handler.get_user_data(user_id, server_id)
+                except DatabaseUnavailable:
+                    points, acumen = None, -1 # scored anyway, the points are deferred below
 
                 streak = 1
-                if multiplier_answer_not_first == 1 and user_having_streak[0] == user_id:
+                if is_first and user_having_streak[0] == user_id:
                     user_having_streak[1] += 1
                     streak = user_having_streak[1]
-                elif multiplier_answer_not_first == 1 or not user_having_streak[0]:
-                    self.streaks[server_id] = [user_id, 1]
+                elif is_first or not user_having_streak[0]:
+                    server.streak = [user_id, 1]
                             
-                base_points = game_state["base_points"] 
-            
-                if self.powerups[user_key] > 0:
-                    daily_multiplier = 2
-                    self.powerups[user_key] -= 1
-                streak_bonus = 42 * (streak // 5) if streak % 5 == 0 else (5 if streak > 5 else 0)
-                start_time = game_state["start_time"].timestamp()
-                elapsed_time = guess_time - start_time
-                if elapsed_time > 220: elapsed_time = 220
-                base_points = base_points * .99816 ** elapsed_time
-                word_points = base_points + streak_bonus 
-                turn_points = int(word_points * daily_multiplier * multiplier_answer_not_first)
-                points += turn_points
-                if acumen<30 and elapsed_time < 30: acumen += 6 # boost brain braining ones
-                # TODO adjust acumen wrt hardness of word
-                # new_acumen =  max(1, min(100, int(acumen + 11 - (acumen / 10)- 30 * (1 - math.exp(-0.025 * elapsed_time)))))
-                new_acumen =  int(acumen + (elapsed_time - acumen)/100)
-
-                # self.acumen_queues[server_id].add_user_message(user_id, new_acumen, datetime.fromtimestamp(guess_time, tz=timezone.utc))
+                powerup = self.db_handler.consume_powerup(user_id, server_id)
+                streak_bonus = scoring.streak_bonus(streak, params)
+                turn_points = int(scoring.turn_points(game_state.base_points, elapsed_time, streak,
+                                                      multiplier_answer_not_first, powerup, params))
+                if points is None:
+                    # no total or acumen without the row, the caller skips the score write for a None total
+                    self.db_handler.defer_points(user_id, server_id, turn_points)
+                    new_acumen = None
+                else:
+                    points += turn_points
+                    new_acumen = int(scoring.next_acumen(acumen, elapsed_time, params))
+
+                self.log_guess(guess_time, server_id, user_id, game_state, elapsed_time, gap, streak, acumen, turn_points, len(guess),
+                               scoring.FLAG_CORRECT | scoring.FLAG_FIRST * is_first
+                               | scoring.FLAG_CAPITAL * has_capital | scoring.FLAG_POWERUP * powerup)
+                if self.on_state_change:
+                    self.on_state_change(server_id)
+                if new_acumen is not None:
+                    if server.acumen_queue is None:
+                        server.acumen_queue = AcumenQueue()
+                    server.acumen_queue.add_user_message(user_id, new_acumen, datetime.fromtimestamp(guess_time, tz=timezone.utc))
                 return turn_points, points, streak_bonus, True, new_acumen
             
             return None
+
+    def log_guess(self, guess_time, server_id, user_id, game_state, elapsed_time, gap, streak, acumen, points, word_length, flags):
+        if self.event_log:
+            self.event_log.record(guess_time, server_id, user_id, game_state.base_points, elapsed_time, gap,
+                                  streak, acumen, points, word_length, flags)
         
     async def use_powerup(self, user_id: int, server_id: int):
-        user_key = self.get_user_key(user_id, server_id)
-        result = await self.db_handler.db.from_("usersanagrams").select("last_powerup").eq("user_id", user_id).eq("server_id", server_id).execute()
-        if result.data:
-            last_powerup = result.data[0].get('last_powerup')
-        else:
+        claimed = await self.db_handler.claim_daily_powerup(user_id, server_id, 3)
+        if claimed is None:
             return "Please play first! 😒"
-        now_ist = datetime.now(self.db_handler.ist)
-        cleaned_last_powerup = clean_iso_string(last_powerup)
-        if cleaned_last_powerup:
-            last_powerup_dt = datetime.fromisoformat(cleaned_last_powerup).astimezone(self.db_handler.ist)
-        if cleaned_last_powerup and (now_ist.date() == last_powerup_dt.date()):
+        if not claimed:
             return "STML? You have already used powerup today!"
-        else:
-            last_powerup_timestamp = now_ist.isoformat()
-            self.powerups[user_key] = 3
-            await self.db_handler.db.from_("usersanagrams").update({"last_powerup": last_powerup_timestamp}).eq("user_id", user_id).eq("server_id", server_id).execute()
         return "2x powerup for next three turns! all the best!"
 
 class CooldownManager:
@@ -489,3 +1305,79 @@ class CooldownManager:
                         self.cooldowns[server_id] * 1.3
                     ))
             return self.cooldowns[server_id]
+
+    def export_server(self, server_id: int) -> dict:
+        return {"cooldown": self.cooldowns.get(server_id), "misses": self.miss_counts.get(server_id, 0)}
+
+    def restore_server(self, server_id: int, state: dict):
+        if state.get("cooldown") is not None:
+            self.cooldowns[server_id] = state["cooldown"]
+        self.miss_counts[server_id] = state.get("misses", 0)
+
+class GameScheduler:
+    """min-heap of per server deadlines (hints, timeouts). one task sleeps until the earliest
+    deadline instead of polling every game, cancelled entries are dropped lazily when they come due"""
+    def __init__(self):
+        self._heap = []  # (deadline, seq, server_id, generation, callback, args)
+        self._generations = defaultdict(int)  # server_id -> bumped on cancel
+        self._seq = 0
+        self._wakeup = asyncio.Event()
+        self._runner = None
+        self._running = set()  # callback tasks still going, the loop only keeps weak references to tasks
+        self.lag_stats = {"fired": 0, "last_lag": 0.0, "max_lag": 0.0, "total_lag": 0.0}
+
+    def schedule(self, server_id: int, deadline: float, callback, *args):
+        """run callback(*args) at the unix timestamp deadline unless server_id is cancelled first"""
+        entry = (deadline, self._seq, server_id, self._generations[server_id], callback, args)
+        self._seq += 1
+        heapq.heappush(self._heap, entry)
+        if self._heap[0] is entry:
+            self._wakeup.set()
+
+    def cancel(self, server_id: int):
+        self._generations[server_id] += 1
+
+    def pending(self) -> int:
+        return len(self._heap)
+
+    def start(self):
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._runner:
+            self._runner.cancel()
+            self._runner = None
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+            delay = self._heap[0][0] - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            now = time.time()
+            iteration_start = time.perf_counter() if metrics.enabled else 0
+            while self._heap and self._heap[0][0] <= now:
+                deadline, _, server_id, generation, callback, args = heapq.heappop(self._heap)
+                if generation != self._generations[server_id]:
+                    continue
+                lag = now - deadline
+                self.lag_stats["fired"] += 1
+                self.lag_stats["last_lag"] = lag
+                self.lag_stats["total_lag"] += lag
+                self.lag_stats["max_lag"] = max(self.lag_stats["max_lag"], lag)
+                if metrics.enabled:
+                    metrics.observe("scheduler_lag_seconds", lag)
+                task = asyncio.create_task(callback(*args))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+            if metrics.enabled:
+                metrics.observe("scheduler_iteration_seconds", time.perf_counter() - iteration_start)
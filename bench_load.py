@@ -0,0 +1,393 @@
+"""multi-server load harness for the anagram game.
+
+runs hundreds of simulated guilds against AnagramGame, CooldownManager and GameScheduler with a fake
+channel/message layer and an in-memory stand-in for the usersanagrams table, replays guess streams
+(chatter, typos, alternates and near-simultaneous correct answers) and prints a json report:
+
+    python bench_load.py --guilds 300 --duration 60 --db-latency 0.05 --out bench_output.json
+
+needs the same word data as the bot (word_score_gloss_sorted.csv / word_bank.bin, other_possible_answers)
+in the working directory. game timings (hints, timeouts, cooldowns) are multiplied by --time-scale so a
+short run still goes through many rounds.
+"""
+import argparse
+import asyncio
+import json
+import random
+import string
+import time
+from collections import Counter
+
+from anagram_bot import AnagramGame, AnagramDatabaseHandler, CooldownManager, GameScheduler
+from journal import ScoreJournal
+from metrics import metrics
+from outbound import PRIORITY_ANSWER, PRIORITY_TYPO
+
+
+def percentile(samples, p):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+def summary(samples):
+    return {
+        "count": len(samples),
+        "p50": percentile(samples, 50),
+        "p99": percentile(samples, 99),
+        "max": max(samples) if samples else 0.0,
+    }
+
+
+class InMemoryResult:
+    def __init__(self, data):
+        self.data = data
+
+
+class InMemoryQuery:
+    """just enough of the postgrest query builder for AnagramDatabaseHandler"""
+    def __init__(self, table):
+        self.table = table
+        self.op = None
+        self.payload = None
+        self.columns = None
+        self.filters = []
+        self.order_by = None
+        self.row_limit = None
+        self.options = {}
+
+    def select(self, columns):
+        self.op, self.columns = "select", [column.strip() for column in columns.split(",")]
+        return self
+
+    def insert(self, payload):
+        self.op, self.payload = "insert", payload
+        return self
+
+    def update(self, payload):
+        self.op, self.payload = "update", payload
+        return self
+
+    def upsert(self, payload, **options):
+        self.op, self.payload, self.options = "upsert", payload, options
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def in_(self, column, values):
+        values = set(values)
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def order(self, column, desc=False):
+        self.order_by = (column, desc)
+        return self
+
+    def limit(self, count):
+        self.row_limit = count
+        return self
+
+    def _matching(self):
+        return [row for row in self.table.rows.values() if all(check(row) for check in self.filters)]
+
+    async def execute(self):
+        return await self.table.execute(self)
+
+
+class InMemoryUsersTable:
+    """async stand-in for the usersanagrams table with configurable per call latency"""
+    def __init__(self, latency=0.0, jitter=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.rows = {}  # (user_id, server_id) -> row
+        self.calls = Counter()
+        self.call_latencies = []
+
+    def from_(self, table_name):
+        return InMemoryQuery(self)
+
+    async def execute(self, query):
+        start = time.perf_counter()
+        self.calls[query.op] += 1
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+
+        if query.op == "select":
+            data = query._matching()
+            if query.order_by:
+                column, desc = query.order_by
+                data.sort(key=lambda row: row[column], reverse=desc)
+            if query.row_limit:
+                data = data[:query.row_limit]
+            data = [{column: row.get(column) for column in query.columns} for row in data]
+        elif query.op == "update":
+            data = query._matching()
+            for row in data:
+                row.update(query.payload)
+        else:
+            payload = query.payload if isinstance(query.payload, list) else [query.payload]
+            data = []
+            for entry in payload:
+                key = (entry["user_id"], entry["server_id"])
+                if key in self.rows and (query.op == "insert" or query.options.get("ignore_duplicates")):
+                    continue
+                self.rows.setdefault(key, {"acumen_level": 50, "points": 0}).update(entry)
+                data.append(self.rows[key])
+        self.call_latencies.append(time.perf_counter() - start)
+        return InMemoryResult(data)
+
+
+class FakeMessage:
+    def __init__(self, bench, channel, sent_at):
+        self.bench = bench
+        self.channel = channel
+        self.id = id(self)
+        self.sent_at = sent_at
+
+    async def reply(self, *args, **kwargs):
+        self.bench.reply_latencies.append(time.perf_counter() - self.sent_at)
+
+    async def add_reaction(self, emoji):
+        self.bench.reply_latencies.append(time.perf_counter() - self.sent_at)
+
+
+class FakeChannel:
+    def __init__(self, channel_id, latency=0.0):
+        self.id = channel_id
+        self.latency = latency
+        self.sent = 0
+
+    async def send(self, *args, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.sent += 1
+
+
+class TimedLock(asyncio.Lock):
+    """asyncio.Lock that records how long each acquire waited"""
+    samples = []
+
+    async def acquire(self):
+        start = time.perf_counter()
+        result = await super().acquire()
+        TimedLock.samples.append(time.perf_counter() - start)
+        return result
+
+
+class LoadBench:
+    def __init__(self, args):
+        self.args = args
+        self.scale = args.time_scale
+        self.table = InMemoryUsersTable(args.db_latency, args.db_jitter)
+        journal = ScoreJournal(args.journal) if args.journal else None
+        self.db_handler = AnagramDatabaseHandler(self.table, write_behind=args.write_behind, max_staleness=1.0, journal=journal)
+        self.game = AnagramGame(self.db_handler)
+        for server_id in range(1, args.guilds + 1):
+            self.game.servers.get(server_id).lock = TimedLock()
+        self.game.on_new_game = self.schedule_game
+        self.cooldowns = CooldownManager()
+        self.scheduler = GameScheduler()
+        self.channels = {server_id: FakeChannel(server_id, args.send_latency) for server_id in range(1, args.guilds + 1)}
+        self.reply_latencies = []
+        self.handle_latencies = []
+        self.loop_lag = []
+        self.messages = 0
+        self.answers = 0
+        self.rounds = 0
+        self.running = True
+        metrics.enabled = args.metrics
+
+    def schedule_game(self, server_id, game_state):
+        # same deadlines as anagram_state.schedule_game, scaled down
+        self.scheduler.cancel(server_id)
+        start_time = game_state.start_time.timestamp()
+        max_time = 30 if game_state.is_bomb else 240
+        self.scheduler.schedule(server_id, start_time + (15 if game_state.is_bomb else 30) * self.scale, self.hint_due, server_id, game_state, 1)
+        if not game_state.is_bomb:
+            self.scheduler.schedule(server_id, start_time + 120 * self.scale, self.hint_due, server_id, game_state, 2)
+        self.scheduler.schedule(server_id, start_time + max_time * self.scale, self.timeout_due, server_id, game_state)
+        self.rounds += 1
+
+    async def hint_due(self, server_id, game_state, hint_type):
+        if self.game.current_game(server_id) is game_state:
+            await self.game.send_hint(server_id, self.channels[server_id], hint_type)
+
+    async def timeout_due(self, server_id, game_state):
+        async with self.game.locked(server_id):
+            if self.game.current_game(server_id) is not game_state or game_state.cooldown_adjusted:
+                return
+        time_to_sleep = await self.cooldowns.adjust_cooldown(server_id, False)
+        self.game.servers.get(server_id).streak = [0, 0]
+        await self.game.transition_to_new_game(server_id, self.channels[server_id], max(time_to_sleep * self.scale, 0.01), timeout=True)
+
+    async def on_guess(self, server_id, user_id, text):
+        """mirror of the one-word branch of main.on_message"""
+        self.messages += 1
+        sent_at = time.perf_counter()
+        message = FakeMessage(self, self.channels[server_id], sent_at)
+        game = self.game
+        server = game.servers.get(server_id, touch=True)
+        game_state = server.game
+        if not game_state:
+            return
+        word = ''.join(filter(str.isalpha, text))
+        if not game.could_be_answer(server_id, word):
+            self.handle_latencies.append(time.perf_counter() - sent_at)
+            return
+        answer_check = await game.check_guess(user_id, server_id, word, time.time())
+        self.handle_latencies.append(time.perf_counter() - sent_at)
+        if not answer_check:
+            return
+        if len(answer_check) == 2:
+            pts, hint = answer_check
+            if pts:
+                game.outbox.reply(message, hint, priority=PRIORITY_ANSWER)
+            elif hint and len(hint) == 1:
+                game.outbox.react(message, hint)
+            elif hint:
+                game.outbox.reply(message, hint, priority=PRIORITY_TYPO, merge_key=("typo", hint))
+            return
+
+        turn_points, total_points, streak_bonus, correct, new_acumen = answer_check
+        self.answers += 1
+        if not await game.acquire_lock(server_id):
+            return
+        try:
+            # game_state is the word this answer was checked against, a racing answer may have replaced server.game already
+            first = not game_state.cooldown_adjusted
+            if first:
+                time_to_sleep = await self.cooldowns.adjust_cooldown(server_id, True)
+                game_state.cooldown_adjusted = True
+                self.scheduler.cancel(server_id)
+            game.outbox.reply(message, "correct", priority=PRIORITY_ANSWER)
+        finally:
+            server.lock.release()
+        if total_points is not None: # None when the points were deferred, see AnagramGame.check_guess
+            await self.db_handler.update_user_data(user_id, server_id, total_points, new_acumen)
+        if first:
+            await asyncio.sleep(1.2 * self.scale)
+            await game.transition_to_new_game(server_id, self.channels[server_id], max(time_to_sleep * self.scale, 0.01), timeout=False)
+
+    def typo(self, word):
+        letters = list(word)
+        position = random.randrange(len(letters))
+        edit = random.random()
+        if edit < 0.4:
+            letters[position] = random.choice(string.ascii_lowercase)
+        elif edit < 0.7:
+            letters.pop(position)
+        elif position < len(letters) - 1:
+            letters[position], letters[position + 1] = letters[position + 1], letters[position]
+        return ''.join(letters)
+
+    async def guild_stream(self, server_id):
+        """chatter, typos and alternates while a word is live, then one or a burst of correct answers"""
+        players = [server_id * 1000 + player for player in range(self.args.players)]
+        while self.running:
+            game_state = self.game.current_game(server_id)
+            if not game_state:
+                await asyncio.sleep(0.05)
+                continue
+            word = game_state.word
+            solve_at = time.time() + random.expovariate(1 / (self.args.solve_time * self.scale))
+            while self.running and time.time() < solve_at and self.game.current_game(server_id) is game_state:
+                await asyncio.sleep(random.expovariate(self.args.chat_rate))
+                roll = random.random()
+                if roll < 0.6:
+                    text = ''.join(random.choices(string.ascii_lowercase, k=random.randint(2, 9)))
+                elif roll < 0.9 or not game_state.alternates:
+                    text = self.typo(word)
+                else:
+                    text = random.choice(list(game_state.alternates))
+                asyncio.create_task(self.on_guess(server_id, random.choice(players), text))
+            if not self.running or self.game.current_game(server_id) is not game_state:
+                continue
+            # near-simultaneous correct answers from up to three players
+            burst = 1 if random.random() > self.args.burst_rate else random.randint(2, 3)
+            for user_id in random.sample(players, min(burst, len(players))):
+                asyncio.create_task(self.on_guess(server_id, user_id, word.capitalize() if random.random() < 0.3 else word))
+                await asyncio.sleep(random.uniform(0, 0.3))
+            while self.running and self.game.current_game(server_id) is game_state:
+                await asyncio.sleep(0.05)
+
+    async def lag_probe(self, interval=0.05):
+        while self.running:
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            self.loop_lag.append(time.perf_counter() - start - interval)
+
+    async def run(self):
+        self.scheduler.start()
+        self.db_handler.start_write_behind()
+        for server_id in self.channels:
+            await self.game.generate_anagram(server_id)
+        tasks = [asyncio.create_task(self.guild_stream(server_id)) for server_id in self.channels]
+        tasks.append(asyncio.create_task(self.lag_probe()))
+        await asyncio.sleep(self.args.duration)
+        self.running = False
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.game.outbox.join()
+        await self.db_handler.close()
+        self.scheduler.stop()
+        return self.report()
+
+    def report(self):
+        db_calls = sum(self.table.calls.values())
+        return {
+            "config": vars(self.args),
+            "messages": self.messages,
+            "answers": self.answers,
+            "rounds": self.rounds,
+            "guess_to_reply": summary(self.reply_latencies),
+            "guess_handling": summary(self.handle_latencies),
+            "lock_wait": summary(TimedLock.samples),
+            "loop_lag": summary(self.loop_lag),
+            "scheduler_lag": self.scheduler.lag_stats,
+            "db": {
+                "calls": db_calls,
+                "calls_per_answer": db_calls / self.answers if self.answers else 0.0,
+                "by_op": dict(self.table.calls),
+                "latency": summary(self.table.call_latencies),
+            },
+            "guess_filter": self.game.filter_stats,
+            "outbound": dict(self.game.outbox.stats),
+            "write_behind": self.db_handler.flush_stats,
+            "db_breaker": self.db_handler.breaker.stats,
+            "metrics": metrics.snapshot() if metrics.enabled else None,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--guilds", type=int, default=200)
+    parser.add_argument("--players", type=int, default=8, help="players per guild")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of wall time to run")
+    parser.add_argument("--time-scale", type=float, default=0.05, help="multiplier for hint, timeout and cooldown times")
+    parser.add_argument("--chat-rate", type=float, default=2.0, help="messages per second per guild while a word is live")
+    parser.add_argument("--solve-time", type=float, default=60.0, help="mean unscaled seconds until someone answers")
+    parser.add_argument("--burst-rate", type=float, default=0.2, help="share of rounds answered by several players at once")
+    parser.add_argument("--db-latency", type=float, default=0.03)
+    parser.add_argument("--db-jitter", type=float, default=0.02)
+    parser.add_argument("--send-latency", type=float, default=0.02)
+    parser.add_argument("--write-behind", action="store_true")
+    parser.add_argument("--journal", default=None, help="sqlite path, journal every score write there first (implies --write-behind)")
+    parser.add_argument("--metrics", action="store_true", help="turn on the hot path timing hooks and include them in the report")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--out", default=None, help="write the json report here instead of stdout")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    result = asyncio.run(LoadBench(args).run())
+    if args.out:
+        with open(args.out, "w") as out:
+            json.dump(result, out, indent=2)
+    else:
+        print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""incremental checkpoints of per server game state for fast warm restarts.
+
+every change to a server appends one json line holding that server's compact state to an append-only log,
+replaying the log keeps the last line per server. the no-repeat history is logged one picked word per line
+instead of the whole list on every change, replay rebuilds it up to history_limit words. once the log grows past compact_every lines it is folded
+into a snapshot file (written to a temp file and renamed) and truncated.
+"""
+import asyncio
+import json
+import os
+import time
+from typing import Dict
+
+SNAPSHOT_FILE = 'snapshot.json'
+LOG_FILE = 'state.log'
+
+
+class StateCheckpointer:
+    def __init__(self, directory: str = 'checkpoints', compact_every: int = 5000, flush_interval: float = 1.0,
+                 history_limit: int = 200):
+        os.makedirs(directory, exist_ok=True)
+        self.snapshot_path = os.path.join(directory, SNAPSHOT_FILE)
+        self.log_path = os.path.join(directory, LOG_FILE)
+        self.compact_every = compact_every
+        self.flush_interval = flush_interval
+        self.history_limit = history_limit
+        self._drop_torn_tail()
+        self._log = open(self.log_path, 'a')
+        self._log_lines = self._count_lines()
+        self._flusher = None
+
+    def _drop_torn_tail(self):
+        """cut the log back to its last newline, a crash mid write leaves half a line that the next append would glue onto"""
+        if not os.path.exists(self.log_path):
+            return
+        with open(self.log_path, 'rb+') as log:
+            end = size = log.seek(0, os.SEEK_END)
+            keep = 0
+            while end > 0:
+                start = max(0, end - 4096)
+                log.seek(start)
+                newline = log.read(end - start).rfind(b'\n')
+                if newline != -1:
+                    keep = start + newline + 1
+                    break
+                end = start
+            if keep < size:
+                log.truncate(keep)
+                print(f"checkpoint log had a torn last line, dropped {size - keep} bytes")
+
+    def _count_lines(self) -> int:
+        with open(self.log_path, 'r') as log:
+            return sum(1 for _ in log)
+
+    def record(self, server_id: int, state: dict):
+        """buffered append, hits the disk on the next flush"""
+        self._log.write(json.dumps({"s": server_id, "d": state}, separators=(',', ':')) + '\n')
+        self._log_lines += 1
+
+    def record_word(self, server_id: int, word_idx: int):
+        """one word added to a server's no-repeat history"""
+        self._log.write(json.dumps({"s": server_id, "w": word_idx}, separators=(',', ':')) + '\n')
+        self._log_lines += 1
+
+    def flush(self):
+        self._log.flush()
+        os.fsync(self._log.fileno())
+
+    def load(self) -> Dict[int, dict]:
+        """server_id -> latest recorded state"""
+        states = {}
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, 'r') as snapshot:
+                states = {int(server_id): state for server_id, state in json.load(snapshot).items()}
+        self._log.flush()
+        with open(self.log_path, 'r') as log:
+            for line in log:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue # torn line, the records after it are still good
+                server_id = entry["s"]
+                if "w" in entry:
+                    history = states.setdefault(server_id, {}).setdefault("recent_words", [])
+                    history.append(entry["w"])
+                    del history[:-self.history_limit]
+                    continue
+                state = entry["d"]
+                # state lines leave the history to the word lines and the snapshot
+                if "recent_words" not in state and "recent_words" in states.get(server_id, {}):
+                    state["recent_words"] = states[server_id]["recent_words"]
+                states[server_id] = state
+        return states
+
+    def compact(self):
+        states = self.load()
+        tmp_path = self.snapshot_path + '.tmp'
+        with open(tmp_path, 'w') as snapshot:
+            json.dump(states, snapshot, separators=(',', ':'))
+            snapshot.flush()
+            os.fsync(snapshot.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        self._log.close()
+        self._log = open(self.log_path, 'w')
+        self._log_lines = 0
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                if self._log_lines >= self.compact_every:
+                    start = time.perf_counter()
+                    self.compact() # on the loop so no record lands between the reload and the truncate
+                    print(f"checkpoint compacted in {(time.perf_counter() - start) * 1000:.1f}ms")
+                else:
+                    self.flush()
+            except Exception as e:
+                print(f"checkpoint flush failed: {e}")
+
+    def start(self):
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    def close(self):
+        if self._flusher:
+            self._flusher.cancel()
+            self._flusher = None
+        self.flush()
+        self._log.close()
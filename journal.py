@@ -0,0 +1,137 @@
+"""local write-ahead journal for score writes and a circuit breaker for the database.
+
+every usersanagrams row change is written to a sqlite journal (WAL, synchronous=FULL so the commit is on disk)
+before the game acknowledges it, keyed by player so a row only holds the newest state. the write-behind
+flusher replays the journal to supabase and deletes what got through, a crash or a supabase outage just
+leaves rows waiting in the journal for the next start.
+
+points earned while a player's row can't be read (circuit open, player not cached) can't become a full row yet.
+they are added up in a separate deferred table and folded into the row the next time it is read, the row is
+journaled and the deferred points dropped in one commit.
+"""
+import sqlite3
+import time
+from typing import Dict, List, Tuple
+
+
+class DatabaseUnavailable(Exception):
+    """raised instead of calling the database while the circuit breaker is open"""
+
+
+class ScoreJournal:
+    def __init__(self, path: str = 'score_journal.sqlite', fsync: bool = True):
+        self.path = path
+        self._conn = sqlite3.connect(path, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(f"PRAGMA synchronous={'FULL' if fsync else 'NORMAL'}")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS pending (
+            user_id INTEGER NOT NULL,
+            server_id INTEGER NOT NULL,
+            seq INTEGER NOT NULL,
+            points INTEGER NOT NULL,
+            acumen_level INTEGER NOT NULL,
+            last_powerup TEXT,
+            powerup_uses INTEGER NOT NULL,
+            PRIMARY KEY (user_id, server_id))""")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS deferred (
+            user_id INTEGER NOT NULL,
+            server_id INTEGER NOT NULL,
+            points INTEGER NOT NULL,
+            PRIMARY KEY (user_id, server_id))""")
+        self._seq = self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM pending").fetchone()[0]
+        self._seqs = {}  # user_id, server_id -> seq of the newest journaled row
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM pending").fetchone()[0]
+
+    def record(self, row: dict, settle: bool = False) -> int:
+        """journal the full row, durable once this returns. settle drops the player's deferred points in the same
+        commit, for a row that now includes them"""
+        self._seq += 1
+        if settle:
+            self._conn.execute("BEGIN")
+        self._conn.execute("INSERT OR REPLACE INTO pending VALUES (?, ?, ?, ?, ?, ?, ?)", (
+            row["user_id"], row["server_id"], self._seq, row["points"], row["acumen_level"],
+            row["last_powerup"], row["powerup_uses"]))
+        if settle:
+            self._conn.execute("DELETE FROM deferred WHERE user_id = ? AND server_id = ?", (row["user_id"], row["server_id"]))
+            self._conn.execute("COMMIT")
+        self._seqs[(row["user_id"], row["server_id"])] = self._seq
+        return self._seq
+
+    def defer(self, user_id: int, server_id: int, points: int):
+        """add points for a player whose row can't be read right now"""
+        self._conn.execute("INSERT INTO deferred VALUES (?, ?, ?) ON CONFLICT (user_id, server_id) DO UPDATE SET points = points + excluded.points",
+                           (user_id, server_id, points))
+
+    def deferred(self) -> Dict[Tuple[int, int], int]:
+        return {(user_id, server_id): points for user_id, server_id, points in self._conn.execute("SELECT user_id, server_id, points FROM deferred")}
+
+    def pending(self) -> List[dict]:
+        """rows not confirmed by the database yet, oldest first"""
+        rows = self._conn.execute("SELECT user_id, server_id, seq, points, acumen_level, last_powerup, powerup_uses FROM pending ORDER BY seq").fetchall()
+        result = []
+        for user_id, server_id, seq, points, acumen_level, last_powerup, powerup_uses in rows:
+            self._seqs[(user_id, server_id)] = seq
+            result.append({"user_id": user_id, "server_id": server_id, "points": points, "acumen_level": acumen_level,
+                           "last_powerup": last_powerup, "powerup_uses": powerup_uses})
+        return result
+
+    def seqs(self, keys) -> Dict[Tuple[int, int], int]:
+        return {key: self._seqs[key] for key in keys if key in self._seqs}
+
+    def ack(self, seqs: Dict[Tuple[int, int], int]):
+        """drop rows the database now has, unless they were journaled again since"""
+        self._conn.execute("BEGIN")
+        self._conn.executemany("DELETE FROM pending WHERE user_id = ? AND server_id = ? AND seq <= ?",
+                               [(user_id, server_id, seq) for (user_id, server_id), seq in seqs.items()])
+        self._conn.execute("COMMIT")
+        for key, seq in seqs.items():
+            if self._seqs.get(key) == seq:
+                del self._seqs[key]
+
+    def close(self):
+        self._conn.close()
+
+
+class CircuitBreaker:
+    """opens after failure_threshold failures in a row and rejects calls for reset_after seconds,
+    then lets one trial call through (half open) to decide whether to close again"""
+    def __init__(self, failure_threshold: int = 5, reset_after: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self.stats = {"opened": 0, "rejected": 0}
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_after:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._trial:
+            self._trial = True
+            return True
+        self.stats["rejected"] += 1
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                self.stats["opened"] += 1
+            self.opened_at = time.monotonic()
@@ -1,4 +1,16 @@
-from anagram_bot import AnagramGame, CooldownManager, AnagramDatabaseHandler, AcumenQueue
+import os
+import signal
+import time
+from anagram_bot import AnagramGame, CooldownManager, AnagramDatabaseHandler, AcumenQueue, GameScheduler, load_word_data
+from sharding import owned_channels
+from checkpoint import StateCheckpointer
+from scoring import GuessEventLog
+from journal import ScoreJournal, DatabaseUnavailable
+from outbound import PRIORITY_ANSWER, PRIORITY_TYPO
+
+# set by sharding.ShardSupervisor, the bot has to connect with the same shard_id/shard_count
+SHARD_ID = int(os.environ.get("ANAGRAM_SHARD_ID", 0))
+SHARD_COUNT = int(os.environ.get("ANAGRAM_SHARD_COUNT", 1))
 
 async def db_init():
     db = await create_supabase(supabase_url, supabase_key,
@@ -8,9 +20,61 @@ async def db_init():
             schema="public",
         ))
     db_handler = DatabaseHandler(db)
-    anagram_game_db_handler = AnagramDatabaseHandler(db)
+    # score writes land in a local journal first and get replayed to supabase, a slow or down db can't lose them
+    os.makedirs("journal", exist_ok=True)
+    anagram_game_db_handler = AnagramDatabaseHandler(db, write_behind=True, flush_size=50, max_staleness=10,
+        journal=ScoreJournal(f"journal/shard{SHARD_ID}.sqlite"), call_timeout=3)
     return db_handler, anagram_game_db_handler
 db_handler = None
+anagram_game_db_handler = None
+anagram_state_handler = None
+startup_timings = {}  # phase -> seconds of the last startup
+
+async def timed(phase, awaitable):
+    start = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        startup_timings[phase] = time.perf_counter() - start
+
+async def shutdown() -> None:
+    """flush pending score writes, checkpoints, guess events and queued messages before the bot goes down.
+    bot.close runs it first, so ctrl-c, SIGTERM and any other way the bot closes all go through here"""
+    global anagram_game_db_handler, anagram_state_handler
+    db_handler_to_close, state_handler = anagram_game_db_handler, anagram_state_handler
+    anagram_game_db_handler = anagram_state_handler = None  # close can be called more than once
+    # every step on its own, one failing must not skip the rest
+    if db_handler_to_close:
+        try:
+            await db_handler_to_close.close()
+        except Exception as e:
+            logger.error(f"closing the score writer failed: {e}")
+    if state_handler:
+        state_handler.scheduler.stop()
+        try:
+            state_handler.checkpointer.close()
+        except Exception as e:
+            logger.error(f"final checkpoint failed: {e}")
+        try:
+            state_handler.game.event_log.close()
+        except Exception as e:
+            logger.error(f"closing the guess event log failed: {e}")
+        try:
+            await asyncio.wait_for(state_handler.game.outbox.join(), timeout=10)
+        except Exception as e:
+            logger.error(f"queued messages not sent before shutdown: {e!r}")
+
+_close_bot = bot.close
+async def close_bot() -> None:
+    await shutdown() # while the gateway is still up so queued messages go out
+    await _close_bot()
+bot.close = close_bot
+
+closing = None  # bot.close task started by SIGTERM, kept so it can't be garbage collected halfway
+def close_on_signal() -> None:
+    global closing
+    if closing is None:
+        closing = asyncio.create_task(bot.close())
 
 @bot.event
 async def on_ready() -> None:
@@ -20,77 +84,167 @@ async def on_ready() -> None:
     global db_handler
     global anagram_game_db_handler
     global anagram_state_handler
-    db_handler, anagram_game_db_handler = await db_init()
-    anagram_state_handler = anagram_state(anagram_game_db_handler)
-    await anagram_state_handler.initialize_games(anagram_state_handler.allowed_channels)
-    await anagram_state_handler.anagram_loop.start()
+    if anagram_state_handler:
+        return # on_ready fires again after every reconnect, the games are already running
+    start = time.perf_counter()
+    try:
+        # a plain SIGTERM (docker stop, systemd) would skip the flush, close the bot properly instead
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, close_on_signal)
+    except NotImplementedError:
+        pass # no signal handlers on windows, ctrl-c still goes through bot.close
+    # supabase and the word files don't depend on each other, the word data loads in a thread so the gateway stays responsive
+    (db_handler, anagram_game_db_handler), word_data = await asyncio.gather(
+        timed("db", db_init()), timed("word_data", asyncio.to_thread(load_word_data)))
+    anagram_game_db_handler.start_write_behind()
+    anagram_state_handler = anagram_state(anagram_game_db_handler, word_data)
+    await timed("warm_up", anagram_game_db_handler.warm_up(anagram_state_handler.allowed_channels.keys()))
+    anagram_state_handler.scheduler.start()
+    # servers whose word survived the restart keep it, the rest get a fresh game
+    restore_start = time.perf_counter()
+    restored = anagram_state_handler.restore()
+    startup_timings["restore"] = time.perf_counter() - restore_start
+    anagram_state_handler.checkpointer.start()
+    anagram_state_handler.start_eviction()
+    started, failed = await timed("games", anagram_state_handler.initialize_games({server_id: channel_id for server_id, channel_id in anagram_state_handler.allowed_channels.items() if server_id not in restored}))
+    startup_timings["total"] = time.perf_counter() - start
+    print(f"ready: {len(restored)} games restored, {started} started, {failed} failed | " +
+          ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in startup_timings.items()))
 
 cooldown_state_handler = CooldownManager()
 class anagram_state:
-    def __init__(self, anagram_game_db_handler):
+    def __init__(self, anagram_game_db_handler, word_data=None):
         self.db_handler = anagram_game_db_handler
-        self.game = AnagramGame(anagram_game_db_handler)
-        self.allowed_channels = {
+        self.game = AnagramGame(anagram_game_db_handler, word_data)
+        self.allowed_channels = owned_channels({
             # server_id: channel_id
-        }
+        }, SHARD_ID, SHARD_COUNT)
         self.channels = dict()
-    async def initialize_games(self, allowed_channels):
-        try:
-            for server_id, channel_id in allowed_channels.items():
-                channel = bot.get_channel(channel_id)
-                self.channels.update({server_id: channel})
-                if channel:
-                    new_game = await self.game.generate_anagram(server_id)
-                    await channel.send(f"Starting a new game! Anagram: {new_game['anagram']}" +
-                                    (" 💣" if new_game["is_bomb"] else ""))
-        except:
-            pass
-
-    @tasks.loop(seconds=2)
-    async def anagram_loop(self):
-        """Main game loop that handles timing and hints."""
-        for server_id, game_state in list(self.game.game_state.items()):
-                if not game_state:
-                    continue
-                try:
-                    if not await self.game.acquire_lock(server_id):
-                        continue
-                except Exception as E: 
-                    logger.error(E)
-                    print("lock error failed")
-                channel = self.channels[server_id]
-                if not game_state or not game_state.get("start_time", None):
-                    continue
-                elapsed_time = (datetime.now() - game_state["start_time"]).total_seconds()
-                
-                max_time = 30 if game_state["is_bomb"] else 240
-                current_cooldown = cooldown_state_handler.cooldowns[server_id]
-                if current_cooldown > 240:
-                    max_time = current_cooldown - 60
-                
+        self.scheduler = GameScheduler()
+        self.game.on_new_game = self.schedule_game
+        self.checkpointer = StateCheckpointer(f"checkpoints/shard{SHARD_ID}", history_limit=self.game.word_picker.horizon)
+        self.game.on_state_change = self.checkpoint
+        self.game.on_word_picked = self.checkpointer.record_word
+        self.game.on_reload = self.start_reloaded
+        # scored guesses for offline tuning, see replay_scoring.py
+        os.makedirs("events", exist_ok=True)
+        self.game.event_log = GuessEventLog(f"events/guesses.shard{SHARD_ID}.bin")
+        self.evict_interval = 300
+        self._evictor = None
+    async def initialize_games(self, allowed_channels, concurrency=32):
+        """start a game in every channel, at most concurrency at a time. returns (started, failed),
+        a channel that fails is logged and skipped without stopping the others"""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def start_game(server_id, channel_id):
+            async with semaphore:
                 try:
-                    if elapsed_time >= max_time:
-                        if not game_state: continue
-                        time_to_sleep = await cooldown_state_handler.adjust_cooldown(server_id, False)
-                        self.game.cooldown_times[server_id] = time_to_sleep
-                        time_to_sleep = 60 if time_to_sleep == 900 else time_to_sleep
-                        self.game.streaks[server_id] = [0, 0]
-                        self.game.state_locks[server_id].release()
-                        await self.game.transition_to_new_game(server_id, channel, time_to_sleep, timeout = True)
-                        continue
-                    if not game_state["hint1_sent"] and elapsed_time >= (15 if game_state["is_bomb"] else 30):
-                        if self.game.state_locks[server_id].locked():
-                            self.game.state_locks[server_id].release()
-                        await self.game.send_hint(server_id, channel, 1)
-                    if game_state and not game_state["hint2_sent"] and not game_state["is_bomb"] and elapsed_time >= 120:
-                        if self.game.state_locks[server_id].locked():
-                            self.game.state_locks[server_id].release()
-                        await self.game.send_hint(server_id, channel, 2)
-                        
-                except:
-                    self.channels[server_id] = bot.get_channel(self.allowed_channels[server_id])
-                if self.game.state_locks[server_id].locked():
-                    self.game.state_locks[server_id].release()
+                    channel = bot.get_channel(channel_id)
+                    self.channels.update({server_id: channel})
+                    if not channel:
+                        logger.error(f"channel {channel_id} of server {server_id} not found, no game started")
+                        return False
+                    new_game = await self.game.generate_anagram(server_id)
+                    self.game.outbox.send(channel, f"Starting a new game! Anagram: {new_game.anagram}" +
+                                    (" 💣" if new_game.is_bomb else ""), kind="new_word")
+                    return True
+                except Exception as e:
+                    logger.error(f"starting a game in server {server_id} failed: {e}")
+                    return False
+                finally:
+                    await asyncio.sleep(0) # picking a word never awaits, let messages and heartbeats in between channels
+
+        results = await asyncio.gather(*(start_game(server_id, channel_id) for server_id, channel_id in allowed_channels.items()))
+        return sum(results), len(results) - sum(results)
+
+    async def _evict_loop(self):
+        while True:
+            await asyncio.sleep(self.evict_interval)
+            try:
+                evicted = self.game.evict_idle()
+                # an evicted server has no live word, the next message in its channel loads it back with a new one
+                for server_id in evicted:
+                    self.scheduler.cancel(server_id)
+                    self.channels.pop(server_id, None)
+                if evicted:
+                    print(f"evicted {len(evicted)} idle servers, {len(self.game.servers)} loaded")
+            except Exception as e:
+                logger.error(f"eviction failed: {e}")
+
+    def start_reloaded(self, server_id):
+        # the message that loaded an evicted server back gets it a fresh word, through the scheduler so it runs outside the caller
+        self.scheduler.schedule(server_id, time.time(), self.start_game, server_id)
+
+    async def start_game(self, server_id):
+        try:
+            await self.game.transition_to_new_game(server_id, self.get_channel(server_id))
+        except Exception as e:
+            logger.error(e)
+            self.channels[server_id] = bot.get_channel(self.allowed_channels[server_id])
+
+    def start_eviction(self):
+        if self._evictor is None or self._evictor.done():
+            self._evictor = asyncio.create_task(self._evict_loop())
+
+    def checkpoint(self, server_id):
+        state = self.game.export_server(server_id, history=False)
+        state["cooldown"] = cooldown_state_handler.export_server(server_id)
+        self.checkpointer.record(server_id, state)
+
+    def restore(self):
+        """reload streaks, powerups, cooldowns, no-repeat history and live words from the last checkpoint"""
+        restored = set()
+        for server_id, state in self.checkpointer.load().items():
+            if server_id not in self.allowed_channels:
+                continue
+            cooldown_state_handler.restore_server(server_id, state.get("cooldown", {}))
+            if self.game.restore_server(server_id, state):
+                restored.add(server_id)
+        return restored
+
+    def get_channel(self, server_id):
+        channel = self.channels.get(server_id)
+        if channel is None:
+            channel = bot.get_channel(self.allowed_channels[server_id])
+            self.channels[server_id] = channel
+        return channel
+
+    def schedule_game(self, server_id, game_state):
+        """register exact hint and timeout deadlines for a word that just went live"""
+        self.scheduler.cancel(server_id)
+        start_time = game_state.start_time.timestamp()
+        max_time = 30 if game_state.is_bomb else 240
+        current_cooldown = cooldown_state_handler.cooldowns[server_id]
+        if current_cooldown > 240:
+            max_time = current_cooldown - 60
+
+        self.scheduler.schedule(server_id, start_time + (15 if game_state.is_bomb else 30), self.hint_due, server_id, game_state, 1)
+        if not game_state.is_bomb:
+            self.scheduler.schedule(server_id, start_time + 120, self.hint_due, server_id, game_state, 2)
+        self.scheduler.schedule(server_id, start_time + max_time, self.timeout_due, server_id, game_state)
+
+    async def hint_due(self, server_id, game_state, hint_type):
+        if self.game.current_game(server_id) is not game_state:
+            return
+        try:
+            await self.game.send_hint(server_id, self.get_channel(server_id), hint_type)
+        except Exception as e:
+            logger.error(e)
+            self.channels[server_id] = bot.get_channel(self.allowed_channels[server_id])
+
+    async def timeout_due(self, server_id, game_state):
+        async with self.game.locked(server_id):
+            if self.game.current_game(server_id) is not game_state or game_state.cooldown_adjusted:
+                return
+        try:
+            server = self.game.servers.get(server_id)
+            time_to_sleep = await cooldown_state_handler.adjust_cooldown(server_id, False)
+            server.cooldown_time = time_to_sleep
+            time_to_sleep = 60 if time_to_sleep == 900 else time_to_sleep
+            server.streak = [0, 0]
+            await self.game.transition_to_new_game(server_id, self.get_channel(server_id), time_to_sleep, timeout = True)
+        except Exception as e:
+            logger.error(e)
+            self.channels[server_id] = bot.get_channel(self.allowed_channels[server_id])
                     
                     
 @bot.event
@@ -103,29 +257,44 @@ async def on_message(message: discord.Message) -> None:
     
         if message.channel.id == anagram_channels.get(message.guild.id, None):
             game = anagram_state_handler.game
-            game_state = game.game_state[message.guild.id]
+            server = game.servers.get(message.guild.id, touch=True)  # loads evicted servers back
+            game_state = server.game
             guess_time = message.created_at.timestamp()
 
             if msg.startswith(';'):
-                if msg == ';top':
-                    lb = await anagram_game_db_handler.get_leaderboard(message.guild.id)
-                    try:
-                        embed = discord.Embed(title="Leaderboard top 10", description="be careful of these in server:", color=discord.Color.blue())
-                        for user in lb:
-                            embed.add_field(name = '', value=f"{user['server_rank']}. <@{user['user_id']}>: {user['points']} pts / {user['acumen']}s speed avg.", inline=False)
-                        await message.reply(embed=embed, mention_author=False, allowed_mentions=discord.AllowedMentions.none())
+                try:
+                    if msg == ';top':
+                        lb = await anagram_game_db_handler.get_leaderboard(message.guild.id)
+                        try:
+                            embed = discord.Embed(title="Leaderboard top 10", description="be careful of these in server:", color=discord.Color.blue())
+                            for user in lb:
+                                embed.add_field(name = '', value=f"{user['server_rank']}. <@{user['user_id']}>: {user['points']} pts / {user['acumen']}s speed avg.", inline=False)
+                            await message.reply(embed=embed, mention_author=False, allowed_mentions=discord.AllowedMentions.none())
+                            return
+                        except Exception as e:
+                            logger.error(f"Error getting leaderboard {e}")
+                            return
+                    if msg == ';rank':
+                        rank = await anagram_game_db_handler.get_rank(message.author.id, message.guild.id)
+                        if not rank:
+                            await message.reply("Please play first! 😒")
+                            return
+                        await message.reply(f"You are **#{rank['server_rank']}** of {rank['total']} with {rank['points']} pts (top {100 - rank['percentile']:.1f}%)", mention_author=False)
                         return
-                    except Exception as e:
-                        logger.error(f"Error getting leaderboard {e}")
+                    if msg == ';daily':
+                        response = await game.use_powerup(message.author.id, message.guild.id)
+                        await message.reply(response)
                         return
-                if msg == ';daily':
-                    response = await game.use_powerup(message.author.id, message.guild.id)
-                    await message.reply(response)
+                except DatabaseUnavailable:
+                    # the circuit is open, the commands read the db so they wait for it like the totals do
+                    await message.reply("Scores are catching up, try again in a minute ⏳", mention_author=False)
                     return
             elif len(msg.strip().split())==1:
                 if not game_state: 
                     return         
                 word = ''.join(filter(str.isalpha, msg))
+                if not game.could_be_answer(message.guild.id, word):
+                    return
                 answer_check = await game.check_guess(message.author.id, message.guild.id, word, guess_time)
 
                 if not answer_check: 
@@ -134,7 +303,7 @@ async def on_message(message: discord.Message) -> None:
                 if len(answer_check) == 2:
                     pts, hint = answer_check
                     if pts:
-                        await message.reply(f"{hint}", mention_author=False, allowed_mentions=discord.AllowedMentions.none())
+                        game.outbox.reply(message, f"{hint}", priority=PRIORITY_ANSWER, mention_author=False, allowed_mentions=discord.AllowedMentions.none())
                         return
                     elif hint and len(hint) == 1:
                         emoji_map = {
@@ -146,10 +315,11 @@ async def on_message(message: discord.Message) -> None:
                             'u': '\U0001f1fa', 'v': '\U0001f1fb', 'w': '\U0001f1fc', 'x': '\U0001f1fd',
                             'y': '\U0001f1fe', 'z': '\U0001f1ff'
                         }
-                        await message.add_reaction(emoji_map.get(hint, '❓'))
+                        game.outbox.react(message, emoji_map.get(hint, '❓'))
                         return
                     elif hint:
-                        await message.reply(f"{hint}", mention_author=False, allowed_mentions=discord.AllowedMentions.none())
+                        # a burst of identical typo replies collapses into one
+                        game.outbox.reply(message, f"{hint}", priority=PRIORITY_TYPO, merge_key=("typo", hint), mention_author=False, allowed_mentions=discord.AllowedMentions.none())
                         return
                 else:
                     if not game_state: 
@@ -163,33 +333,41 @@ async def on_message(message: discord.Message) -> None:
                         if correct:
                             bouquets = turn_points//300+1
                             response = f'{"🎉"*int(bouquets)}! '
-                            response += f"You got **{turn_points} points** (total: {total_points} and avg. {new_acumen}s speed )"
+                            if total_points is None:
+                                # the db is down and the player wasn't cached, their points are added once the row can be read
+                                print(f"score deferred @{message.author.id} in {message.guild.id} - {turn_points} pts")
+                                response += f"You got **{turn_points} points** (scores are catching up, they'll show in your total soon)"
+                            else:
+                                response += f"You got **{turn_points} points** (total: {total_points} and avg. {new_acumen}s speed )"
 
                             if streak_bonus:
                                 response += f" and a streak bonus: **{streak_bonus} points**!"
                             
-                            if not game.game_state[message.guild.id].get("cooldown_adjusted"):
+                            if not game_state.cooldown_adjusted:
                                 time_to_sleep = await cooldown_state_handler.adjust_cooldown(message.guild.id, True)
-                                game.cooldown_times[message.guild.id] = time_to_sleep
-                                game.game_state[message.guild.id]["cooldown_adjusted"] = True  # Mark as adjusted
+                                server.cooldown_time = time_to_sleep
+                                game_state.cooldown_adjusted = True  # Mark as adjusted
+                                anagram_state_handler.scheduler.cancel(message.guild.id)
                                 response += f" Next word in **{time_to_sleep} seconds**!"
-                                await message.reply(response, mention_author=False, allowed_mentions=discord.AllowedMentions.none())
+                                game.outbox.reply(message, response, priority=PRIORITY_ANSWER, mention_author=False, allowed_mentions=discord.AllowedMentions.none())
+                                if server.lock.locked():
+                                    server.lock.release()
                                 await asyncio.sleep(1.2)
-                                if game.state_locks[message.guild.id].locked():
-                                    game.state_locks[message.guild.id].release()
-                                try:
-                                    await anagram_game_db_handler.update_user_data(message.author.id, message.guild.id, total_points, new_acumen)
-                                except: print(f"score update db fail @{message.author.id} in {message.guild.id} - {total_points} pts")
+                                if total_points is not None:
+                                    try:
+                                        await anagram_game_db_handler.update_user_data(message.author.id, message.guild.id, total_points, new_acumen)
+                                    except: print(f"score update db fail @{message.author.id} in {message.guild.id} - {total_points} pts")
                                 await game.transition_to_new_game(message.guild.id, message.channel, time_to_sleep, timeout=False)
                             else:
-                                time_to_sleep = game.cooldown_times[message.guild.id]
+                                time_to_sleep = server.cooldown_time
                                 response += f" Next word in {time_to_sleep} seconds!"
-                                await message.reply(response, mention_author=False, allowed_mentions=discord.AllowedMentions.none())
-                                if game.state_locks[message.guild.id].locked():
-                                    game.state_locks[message.guild.id].release()
-                                try:
-                                    await anagram_game_db_handler.update_user_data(message.author.id, message.guild.id, total_points, new_acumen)
-                                except: print(f"score update db fail @{message.author.id} in {message.guild.id} - {total_points} pts")
+                                game.outbox.reply(message, response, priority=PRIORITY_ANSWER, mention_author=False, allowed_mentions=discord.AllowedMentions.none())
+                                if server.lock.locked():
+                                    server.lock.release()
+                                if total_points is not None:
+                                    try:
+                                        await anagram_game_db_handler.update_user_data(message.author.id, message.guild.id, total_points, new_acumen)
+                                    except: print(f"score update db fail @{message.author.id} in {message.guild.id} - {total_points} pts")
                         return
                     except Exception as e:
                         print(e)
\ No newline at end of file
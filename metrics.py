@@ -0,0 +1,130 @@
+"""in-process timing hooks for the game hot paths (state locks, db calls, discord sends, scheduler).
+
+everything is a no-op unless metrics.enabled is set (or ANAGRAM_METRICS=1 in the environment),
+call sites check the flag before reading the clock so the disabled cost is one attribute lookup.
+"""
+import json
+import os
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+
+# upper bounds in seconds, the last bucket catches everything slower
+BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+
+
+class Histogram:
+    __slots__ = ("counts", "total", "count", "max")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        """upper bound of the bucket holding the q-th quantile"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class Metrics:
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.histograms = {}  # (name, labels) -> Histogram
+        self.counters = Counter()  # (name, labels) -> count
+        self.hooks = []  # callables(kind, name, labels, value), e.g. to forward to another backend
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+        for hook in self.hooks:
+            hook("histogram", name, labels, value)
+
+    def incr(self, name: str, amount: int = 1, **labels):
+        self.counters[(name, tuple(sorted(labels.items())))] += amount
+        for hook in self.hooks:
+            hook("counter", name, labels, amount)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def reset(self):
+        self.histograms.clear()
+        self.counters.clear()
+
+    def snapshot(self) -> dict:
+        """plain dict view, histograms summarised to count/sum/max and bucket quantiles"""
+        histograms = {}
+        for (name, labels), histogram in self.histograms.items():
+            histograms.setdefault(name, []).append({
+                "labels": dict(labels),
+                "count": histogram.count,
+                "sum": histogram.total,
+                "max": histogram.max,
+                "p50": histogram.quantile(0.5),
+                "p99": histogram.quantile(0.99),
+            })
+        counters = {}
+        for (name, labels), count in self.counters.items():
+            counters.setdefault(name, []).append({"labels": dict(labels), "value": count})
+        return {"histograms": histograms, "counters": counters}
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot())
+
+    def to_prometheus(self) -> str:
+        lines = []
+        for (name, labels), count in sorted(self.counters.items()):
+            lines.append(f"{name}{_labels(labels)} {count}")
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            cumulative = 0
+            for bound, count in zip(BUCKETS, histogram.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {histogram.total}")
+            lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str, fmt: str = "json"):
+        with open(path, "w") as out:
+            out.write(self.to_prometheus() if fmt == "prometheus" else self.to_json())
+
+
+def _labels(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+metrics = Metrics(enabled=os.environ.get("ANAGRAM_METRICS") == "1")
@@ -0,0 +1,54 @@
+"""edit distance for typo and near miss hints.
+
+check_hints only ever compares a guess with the live answer and the alternates nobody found yet, a handful of
+words that share a length, so a banded distance check per word is all it needs.
+"""
+
+
+def bounded_damerau_levenshtein(word1: str, word2: str, max_distance: int = 1) -> int:
+    """optimal string alignment distance restricted to the diagonal band of width max_distance.
+    returns max_distance + 1 as soon as the distance is known to exceed the threshold"""
+    len1, len2 = len(word1), len(word2)
+    over = max_distance + 1
+    if abs(len1 - len2) > max_distance:
+        return over
+
+    # a shared prefix and suffix never change the distance, typos usually leave only a few letters in between
+    start = 0
+    while start < len1 and start < len2 and word1[start] == word2[start]:
+        start += 1
+    while len1 > start and len2 > start and word1[len1-1] == word2[len2-1]:
+        len1 -= 1
+        len2 -= 1
+    if start or len1 < len(word1) or len2 < len(word2):
+        word1, word2 = word1[start:len1], word2[start:len2]
+        len1, len2 = len1 - start, len2 - start
+    if not len1 or not len2:
+        return min(len1 + len2, over)
+
+    # rows only hold the band, everything outside it is treated as over the threshold
+    prev2 = None
+    prev = [j if j <= max_distance else over for j in range(len2 + 1)]
+    for i in range(1, len1 + 1):
+        cur = [over] * (len2 + 1)
+        if i <= max_distance:
+            cur[0] = i
+        row_min = cur[0]
+        for j in range(max(1, i - max_distance), min(len2, i + max_distance) + 1):
+            cost = 0 if word1[i-1] == word2[j-1] else 1
+            value = min(
+                prev[j] + 1,    # Deletion
+                cur[j-1] + 1,    # Insertion
+                prev[j-1] + cost  # Substitution
+            )
+            if prev2 and i > 1 and j > 1 and word1[i-1] == word2[j-2] and word1[i-2] == word2[j-1]:
+                value = min(value, prev2[j-2] + 1)
+            cur[j] = min(value, over)
+            if cur[j] < row_min:
+                row_min = cur[j]
+        if row_min > max_distance:
+            return over
+        prev2, prev = prev, cur
+
+    return prev[len2]
+
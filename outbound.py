@@ -0,0 +1,110 @@
+"""rate-limit aware outbound discord queue.
+
+game code enqueues sends, replies and reactions and returns right away, so nothing awaits discord while
+holding a state lock. each channel gets a priority queue drained by its own worker, which keeps under
+discord's per channel buckets, backs off on 429s and drops duplicates that are still waiting
+(same reaction on the same message, the same typo reply in a burst).
+"""
+import asyncio
+import heapq
+import time
+from collections import Counter, deque
+
+import discord
+
+from metrics import metrics
+
+PRIORITY_GAME = 0  # new words and time's up, the game can't move on without them
+PRIORITY_ANSWER = 1
+PRIORITY_HINT = 1
+PRIORITY_TYPO = 2  # typo replies and letter reactions
+
+# bucket -> (requests, per seconds) allowed in one channel
+RATE_LIMITS = {
+    "message": (5, 5.0),
+    "reaction": (4, 1.0),
+}
+
+
+class OutboundQueue:
+    def __init__(self, rate_limits=RATE_LIMITS, max_retries=3):
+        self.rate_limits = rate_limits
+        self.max_retries = max_retries
+        self._queues = {}  # channel_id -> heap of (priority, seq, bucket, kind, merge_key, send, args, kwargs, tries)
+        self._workers = {}  # channel_id -> drain task
+        self._merge_keys = {}  # channel_id -> merge keys still waiting
+        self._sent = {}  # (channel_id, bucket) -> send times inside the current window
+        self._seq = 0
+        self.stats = Counter()
+
+    def send(self, channel, *args, priority=PRIORITY_GAME, merge_key=None, kind="send", **kwargs):
+        self._enqueue(channel.id, priority, "message", kind, merge_key, channel.send, args, kwargs)
+
+    def reply(self, message, *args, priority=PRIORITY_ANSWER, merge_key=None, kind="reply", **kwargs):
+        self._enqueue(message.channel.id, priority, "message", kind, merge_key, message.reply, args, kwargs)
+
+    def react(self, message, emoji, priority=PRIORITY_TYPO):
+        self._enqueue(message.channel.id, priority, "reaction", "reaction", ("react", message.id, emoji), message.add_reaction, (emoji,), {})
+
+    def pending(self, channel_id=None) -> int:
+        if channel_id is not None:
+            return len(self._queues.get(channel_id, ()))
+        return sum(len(queue) for queue in self._queues.values())
+
+    def _enqueue(self, channel_id, priority, bucket, kind, merge_key, send, args, kwargs, tries=0):
+        merge_keys = self._merge_keys.setdefault(channel_id, set())
+        if merge_key is not None:
+            if merge_key in merge_keys:
+                self.stats["merged"] += 1
+                return
+            merge_keys.add(merge_key)
+        queue = self._queues.setdefault(channel_id, [])
+        heapq.heappush(queue, (priority, self._seq, bucket, kind, merge_key, send, args, kwargs, tries))
+        self._seq += 1
+        self.stats["queued"] += 1
+        worker = self._workers.get(channel_id)
+        if worker is None or worker.done():
+            self._workers[channel_id] = asyncio.create_task(self._drain(channel_id))
+
+    async def _throttle(self, channel_id, bucket):
+        limit, per = self.rate_limits[bucket]
+        sent = self._sent.setdefault((channel_id, bucket), deque())
+        now = time.monotonic()
+        while sent and now - sent[0] >= per:
+            sent.popleft()
+        if len(sent) >= limit:
+            self.stats["throttled"] += 1
+            await asyncio.sleep(per - (now - sent[0]))
+            sent.popleft()
+        sent.append(time.monotonic())
+
+    async def _drain(self, channel_id):
+        queue = self._queues[channel_id]
+        merge_keys = self._merge_keys[channel_id]
+        while queue:
+            priority, _, bucket, kind, merge_key, send, args, kwargs, tries = heapq.heappop(queue)
+            merge_keys.discard(merge_key)
+            await self._throttle(channel_id, bucket)
+            start = time.perf_counter() if metrics.enabled else 0
+            try:
+                await send(*args, **kwargs)
+                self.stats["sent"] += 1
+            except discord.HTTPException as e:
+                if getattr(e, "status", None) == 429 and tries < self.max_retries:
+                    self.stats["rate_limited"] += 1
+                    await asyncio.sleep(getattr(e, "retry_after", None) or 1.0)
+                    self._enqueue(channel_id, priority, bucket, kind, merge_key, send, args, kwargs, tries + 1)
+                else:
+                    self.stats["failed"] += 1
+                    print(f"outbound {kind} to {channel_id} failed: {e}")
+            except Exception as e:
+                self.stats["failed"] += 1
+                print(f"outbound {kind} to {channel_id} failed: {e}")
+            if metrics.enabled:
+                metrics.observe("discord_send_seconds", time.perf_counter() - start, kind=kind)
+        del self._workers[channel_id]
+
+    async def join(self):
+        """wait until every queued message went out, e.g. before shutdown"""
+        while self._workers:
+            await asyncio.gather(*list(self._workers.values()), return_exceptions=True)
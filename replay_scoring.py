@@ -0,0 +1,137 @@
+"""re-score logged guesses under other scoring parameters.
+
+reads the binary guess event logs the bot writes (events/guesses.shard*.bin, layout in scoring.py) and runs every
+combination of the given parameter values over all of them at once with numpy, using the same scoring functions
+as the live game. prints a json report per parameter set: point distributions, how the points spread over players
+and how often second answers and late answers score:
+
+    python replay_scoring.py events/*.bin --set decay=.99816,.999 --set late_multiplier=0.5,0.75 --out replay.json
+
+the first set is always the live parameters, its drift against the logged points should stay around zero.
+"""
+import argparse
+import itertools
+import json
+import os
+
+import numpy as np
+
+import scoring
+
+EVENT_DTYPE = np.dtype([
+    ('time', '<f8'), ('server_id', '<u8'), ('user_id', '<u8'), ('base_points', '<i4'), ('elapsed', '<f4'),
+    ('gap', '<f4'), ('streak', '<u2'), ('acumen', '<i2'), ('points', '<i4'), ('word_len', 'u1'), ('flags', 'u1'),
+])
+assert EVENT_DTYPE.itemsize == scoring.EVENT.size
+
+
+def load_events(paths) -> np.ndarray:
+    chunks = []
+    for path in paths:
+        # a crash can leave half a record at the end, drop it
+        chunks.append(np.fromfile(path, dtype=EVENT_DTYPE, count=os.path.getsize(path) // EVENT_DTYPE.itemsize))
+    events = np.concatenate(chunks) if chunks else np.empty(0, dtype=EVENT_DTYPE)
+    return events[np.argsort(events['time'], kind='stable')]
+
+
+def parse_grid(settings):
+    """["decay=.99816,.999", ...] -> list of ScoringParams, live params first"""
+    axes = []
+    for setting in settings:
+        name, _, values = setting.partition('=')
+        if name not in scoring.ScoringParams._fields:
+            raise ValueError(f"unknown scoring parameter {name!r}, pick from {', '.join(scoring.ScoringParams._fields)}")
+        kind = type(getattr(scoring.DEFAULT_PARAMS, name))
+        axes.append([(name, kind(value)) for value in values.split(',')])
+    grid = [scoring.DEFAULT_PARAMS]
+    for combo in itertools.product(*axes):
+        params = scoring.DEFAULT_PARAMS._replace(**dict(combo))
+        if params not in grid:
+            grid.append(params)
+    return grid
+
+
+def rescore(events: np.ndarray, params: scoring.ScoringParams):
+    """points every event would have earned under params, and the acumen each correct answer moves to"""
+    flags = events['flags']
+    correct = (flags & scoring.FLAG_CORRECT) != 0
+    partial = (flags & scoring.FLAG_PARTIAL) != 0
+    elapsed = events['elapsed'].astype(np.float64)
+    multiplier = scoring.answer_multiplier(events['gap'].astype(np.float64), (flags & scoring.FLAG_FIRST) != 0,
+                                           (flags & scoring.FLAG_CAPITAL) != 0, events['word_len'].astype(np.int64), params)
+    points = scoring.turn_points(events['base_points'].astype(np.float64), elapsed, events['streak'].astype(np.int64),
+                                 multiplier, (flags & scoring.FLAG_POWERUP) != 0, params)
+    points = np.where(correct, points.astype(np.int64), 0) + partial * params.partial_points
+    acumen = events['acumen'].astype(np.float64)
+    # answers that came too late live were never looked up, their acumen is -1
+    moved = correct & (multiplier > 0) & (acumen >= 0)
+    new_acumen = np.where(moved, scoring.next_acumen(acumen, elapsed, params).astype(np.int64), -1)
+    return points, new_acumen
+
+
+def distribution(values: np.ndarray) -> dict:
+    if not len(values):
+        return {"count": 0}
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return {"count": int(len(values)), "mean": float(values.mean()), "p50": float(p50), "p90": float(p90),
+            "p99": float(p99), "max": float(values.max())}
+
+
+def gini(totals: np.ndarray) -> float:
+    if not len(totals) or not totals.sum():
+        return 0.0
+    totals = np.sort(totals)
+    ranks = np.arange(1, len(totals) + 1)
+    return float((2 * ranks - len(totals) - 1) @ totals / (len(totals) * totals.sum()))
+
+
+def report(events: np.ndarray, params: scoring.ScoringParams) -> dict:
+    points, new_acumen = rescore(events, params)
+    flags = events['flags']
+    correct = (flags & scoring.FLAG_CORRECT) != 0
+    first = (flags & scoring.FLAG_FIRST) != 0
+    second = correct & ~first
+
+    # per player totals, a player is a (server, user) pair like in the usersanagrams table
+    players = np.stack([events['server_id'], events['user_id']], axis=1)
+    _, player_idx = np.unique(players, axis=0, return_inverse=True)
+    totals = np.bincount(player_idx.ravel(), weights=points)
+    top = np.sort(totals)[::-1][:max(1, len(totals) // 10)]
+
+    moved = new_acumen >= 0
+    return {
+        "params": params._asdict(),
+        "events": int(len(events)),
+        "players": int(len(totals)),
+        "points_total": int(points.sum()),
+        "drift_vs_logged": int(points.sum() - events['points'].sum()),
+        "turn_points": distribution(points[correct & (points > 0)]),
+        "first_answers": distribution(points[first]),
+        "second_answers": distribution(points[second & (points > 0)]),
+        "second_answers_scoring": float((points[second] > 0).mean()) if second.any() else 0.0,
+        "player_totals": distribution(totals),
+        "gini": gini(totals),
+        "top_decile_share": float(top.sum() / totals.sum()) if totals.sum() else 0.0,
+        "acumen_change": distribution((new_acumen - events['acumen'])[moved].astype(np.float64)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="+", help="guess event logs")
+    parser.add_argument("--set", dest="settings", action="append", default=[], metavar="NAME=V1,V2",
+                        help="values to try for one ScoringParams field, repeat for a grid")
+    parser.add_argument("--out", default=None, help="write the json report here instead of stdout")
+    args = parser.parse_args()
+
+    events = load_events(args.paths)
+    result = [report(events, params) for params in parse_grid(args.settings)]
+    if args.out:
+        with open(args.out, "w") as out:
+            json.dump(result, out, indent=2)
+    else:
+        print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
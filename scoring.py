@@ -0,0 +1,102 @@
+"""scoring rules for a guess, shared by the live game and the offline replay (replay_scoring.py).
+
+every function is plain arithmetic with comparisons instead of branches, so the same code scores one guess
+with python numbers or millions of logged guesses with numpy arrays. results are floats, callers truncate
+with int() (or .astype(int) on arrays) like the game always did.
+
+the bot appends one fixed size record per scored guess to a binary event log:
+    time        f8  guess timestamp
+    server_id   u8
+    user_id     u8
+    base_points i4  base points of the word
+    elapsed     f4  seconds since the word went up, not clamped
+    gap         f4  seconds behind the first correct answer, 0 for the first one
+    streak      u2  streak after this answer
+    acumen      i2  acumen before this answer
+    points      i4  points awarded
+    word_len    u1
+    flags       u1  see FLAG_*
+"""
+import struct
+from typing import NamedTuple
+
+
+class ScoringParams(NamedTuple):
+    decay: float = .99816  # per second since the word went up
+    max_elapsed: float = 220  # decay stops here
+    streak_every: int = 5  # every n-th answer in a row pays streak_bonus * (streak // n)
+    streak_bonus: float = 42
+    streak_tail_bonus: float = 5  # the answers in between once past the first n
+    buffer_per_letter: float = 0.1  # near tie window for second answers, grows with word length
+    capital_grace: float = 0.3  # extra window for guesses typed with a capital (phone keyboards)
+    late_multiplier: float = 0.5  # second answers inside the window
+    powerup_multiplier: float = 2
+    partial_points: int = 20  # alternate answers
+    acumen_boost_below: float = 30
+    acumen_boost_within: float = 30
+    acumen_boost: float = 6  # fast solvers with low acumen
+    acumen_rate: float = 100  # acumen moves 1/rate of the way towards the solve time
+
+
+DEFAULT_PARAMS = ScoringParams()
+
+FLAG_CORRECT = 1
+FLAG_FIRST = 2
+FLAG_CAPITAL = 4
+FLAG_POWERUP = 8
+FLAG_PARTIAL = 16
+
+EVENT = struct.Struct('<dQQiffHhiBB')
+
+
+def clamp_elapsed(elapsed, params=DEFAULT_PARAMS):
+    over = elapsed > params.max_elapsed
+    return elapsed * (1 - over) + params.max_elapsed * over
+
+
+def buffer_time(word_length, params=DEFAULT_PARAMS):
+    # handle users whose network maybe slow and users who could be on mobile (dont cheat) with exact timestamps
+    return params.buffer_per_letter * word_length - params.buffer_per_letter * word_length * word_length // 10
+
+
+def answer_multiplier(gap, is_first, has_capital, word_length, params=DEFAULT_PARAMS):
+    """1 for the first answer, late_multiplier inside the near tie window, 0 when too late to score"""
+    window = buffer_time(word_length, params) + params.capital_grace * has_capital
+    return is_first + (1 - is_first) * (gap <= window) * params.late_multiplier
+
+
+def streak_bonus(streak, params=DEFAULT_PARAMS):
+    on_step = streak % params.streak_every == 0
+    return (params.streak_bonus * (streak // params.streak_every) * on_step
+            + params.streak_tail_bonus * (1 - on_step) * (streak > params.streak_every))
+
+
+def turn_points(base_points, elapsed, streak, multiplier, powerup, params=DEFAULT_PARAMS):
+    word_points = base_points * params.decay ** clamp_elapsed(elapsed, params) + streak_bonus(streak, params)
+    return word_points * (1 + (params.powerup_multiplier - 1) * powerup) * multiplier
+
+
+def next_acumen(acumen, elapsed, params=DEFAULT_PARAMS):
+    elapsed = clamp_elapsed(elapsed, params)
+    acumen = acumen + params.acumen_boost * ((acumen < params.acumen_boost_below) & (elapsed < params.acumen_boost_within)) # boost brain braining ones
+    # TODO adjust acumen wrt hardness of word
+    return acumen + (elapsed - acumen) / params.acumen_rate
+
+
+class GuessEventLog:
+    """buffered append-only writer for the guess event log, a crash loses at most the unflushed tail"""
+    def __init__(self, path: str, buffer_size: int = 64 * 1024):
+        self.path = path
+        self._file = open(path, 'ab', buffering=buffer_size)
+        self.written = 0
+
+    def record(self, guess_time, server_id, user_id, base_points, elapsed, gap, streak, acumen, points, word_length, flags):
+        self._file.write(EVENT.pack(guess_time, server_id, user_id, int(base_points), elapsed, gap,
+                                    min(streak, 0xffff), max(-0x8000, min(acumen, 0x7fff)), points, min(word_length, 0xff), flags))
+        self.written += 1
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
@@ -0,0 +1,111 @@
+"""run the game as several worker processes, each owning a slice of the guilds.
+
+guilds are routed with discord's own shard formula, so a worker started with ANAGRAM_SHARD_ID / ANAGRAM_SHARD_COUNT
+only ever receives gateway events for the guilds it owns when the bot connects with the same shard_id and shard_count.
+the word bank is memory mapped read-only, so every worker shares the same pages. the supervisor compiles it before
+spawning anyone, so workers starting together never race to rebuild it.
+
+    python sharding.py 4            # supervise 4 shards of main.py
+"""
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+from word_bank import ensure_word_bank
+
+
+def shard_for(server_id: int, shard_count: int) -> int:
+    """discord's guild -> shard routing"""
+    return (server_id >> 22) % shard_count
+
+
+def partition_channels(allowed_channels: Dict[int, int], shard_count: int) -> List[Dict[int, int]]:
+    shards = [{} for _ in range(shard_count)]
+    for server_id, channel_id in allowed_channels.items():
+        shards[shard_for(server_id, shard_count)][server_id] = channel_id
+    return shards
+
+
+def owned_channels(allowed_channels: Dict[int, int], shard_id: int, shard_count: int) -> Dict[int, int]:
+    return {server_id: channel_id for server_id, channel_id in allowed_channels.items()
+            if shard_for(server_id, shard_count) == shard_id}
+
+
+class ShardSupervisor:
+    """starts one worker process per shard and restarts each one on its own when it dies"""
+    def __init__(self, shard_count: int, command=None, restart_delay=5.0, max_restart_delay=300.0):
+        self.shard_count = shard_count
+        self.command = command or [sys.executable, "main.py"]
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.processes = {}  # shard_id -> Popen
+        self.restarts = {}  # shard_id -> consecutive restarts, drives the backoff
+        self._next_start = {}  # shard_id -> monotonic time the shard may be started again
+        self.started_at = {}  # shard_id -> monotonic time of the last spawn
+
+    def _spawn(self, shard_id: int):
+        env = dict(os.environ, ANAGRAM_SHARD_ID=str(shard_id), ANAGRAM_SHARD_COUNT=str(self.shard_count))
+        self.processes[shard_id] = subprocess.Popen(self.command, env=env)
+        self.started_at[shard_id] = time.monotonic()
+
+    def start(self):
+        if ensure_word_bank():
+            print("compiled the word bank for the shards")
+        for shard_id in range(self.shard_count):
+            self._spawn(shard_id)
+            self.restarts[shard_id] = 0
+
+    def restart(self, shard_id: int):
+        process = self.processes.get(shard_id)
+        if process and process.poll() is None:
+            process.terminate()
+            process.wait()
+        self._next_start.pop(shard_id, None)
+        self._spawn(shard_id)
+
+    def resize(self, shard_count: int):
+        """guilds move between shards when the count changes, so every worker is restarted"""
+        self.stop()
+        self.shard_count = shard_count
+        self.processes.clear()
+        self._next_start.clear()
+        self.start()
+
+    def stop(self):
+        for process in self.processes.values():
+            if process.poll() is None:
+                process.terminate()
+        for process in self.processes.values():
+            process.wait()
+
+    def check(self, healthy_after=600.0):
+        """restart dead shards with exponential backoff, a shard that stayed up healthy_after seconds resets its backoff"""
+        now = time.monotonic()
+        for shard_id, process in list(self.processes.items()):
+            if process.poll() is None:
+                if now - self.started_at[shard_id] > healthy_after:
+                    self.restarts[shard_id] = 0
+                continue
+            if shard_id not in self._next_start:
+                delay = min(self.max_restart_delay, self.restart_delay * 2 ** self.restarts[shard_id])
+                self._next_start[shard_id] = now + delay
+                print(f"shard {shard_id} exited with {process.returncode}, restarting in {delay:.0f}s")
+            elif now >= self._next_start[shard_id]:
+                del self._next_start[shard_id]
+                self.restarts[shard_id] += 1
+                self._spawn(shard_id)
+
+    def run(self, poll_interval=1.0):
+        self.start()
+        try:
+            while True:
+                time.sleep(poll_interval)
+                self.check()
+        except KeyboardInterrupt:
+            self.stop()
+
+
+if __name__ == "__main__":
+    ShardSupervisor(int(sys.argv[1]) if len(sys.argv) > 1 else 2).run()
@@ -0,0 +1,136 @@
+"""compact binary word bank.
+
+the csv of (Word, Score, Gloss) rows is compiled once into a flat file that gets memory mapped at startup,
+so every process (shards included) shares the same read-only pages and nothing is parsed on boot.
+
+layout, native byte order, every section 4 byte aligned:
+    header      magic, word count, words blob size, gloss blob size
+    levels      6 x uint32, start index of levels 1..5 followed by the word count
+    scores      n x int32
+    word_offs   (n + 1) x uint32 into the words blob
+    gloss_offs  (n + 1) x uint32 into the gloss blob
+    words blob  utf-8, padded to 4 bytes
+    gloss blob  utf-8
+"""
+import csv
+import mmap
+import os
+import struct
+import sys
+from array import array
+from typing import List, Tuple
+
+WORD_BANK_CSV = 'word_score_gloss_sorted.csv'
+WORD_BANK_PATH = 'word_bank.bin'
+# share of the score sorted words below the start of levels 1..5, the hand picked [0, 1025, 5924, 14915, 19100]
+# of the original 19.5k word list. see word_scores.py for where the scores come from
+LEVEL_QUANTILES = (0.0, 0.052564, 0.303795, 0.764872, 0.979487)
+
+MAGIC = b'AWB1'
+HEADER = struct.Struct('=4sIII')
+LEVELS = struct.Struct('=6I')
+
+
+def _pad(blob: bytes) -> bytes:
+    return blob + b'\0' * (-len(blob) % 4)
+
+
+def level_boundaries(count: int, quantiles=LEVEL_QUANTILES) -> List[int]:
+    """start index of every level in a list of count words sorted by score"""
+    return [round(q * count) for q in quantiles]
+
+
+def compile_word_bank(csv_path: str = WORD_BANK_CSV, out_path: str = WORD_BANK_PATH, quantiles=LEVEL_QUANTILES) -> int:
+    """compile the sorted word csv into the binary word bank, returns the number of words written"""
+    scores = array('i')
+    word_offsets, gloss_offsets = array('I', [0]), array('I', [0])
+    words, glosses = bytearray(), bytearray()
+    with open(csv_path, 'r') as file:
+        for row in csv.DictReader(file):
+            words += row['Word'].encode()
+            glosses += row['Gloss'].encode()
+            scores.append(int(row['Score']))
+            word_offsets.append(len(words))
+            gloss_offsets.append(len(glosses))
+
+    count = len(scores)
+    level_starts = level_boundaries(count, quantiles) + [count]
+    tmp_path = f'{out_path}.{os.getpid()}.tmp' # processes compiling at once each replace the file whole
+    with open(tmp_path, 'wb') as out:
+        out.write(HEADER.pack(MAGIC, count, len(words), len(glosses)))
+        out.write(LEVELS.pack(*level_starts))
+        out.write(scores.tobytes())
+        out.write(word_offsets.tobytes())
+        out.write(gloss_offsets.tobytes())
+        out.write(_pad(bytes(words)))
+        out.write(bytes(glosses))
+    os.replace(tmp_path, out_path)
+    return count
+
+
+class WordBank:
+    """read-only view over a compiled word bank. words and glosses are decoded only when asked for"""
+    def __init__(self, path: str = WORD_BANK_PATH):
+        with open(path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        magic, count, words_size, gloss_size = HEADER.unpack_from(view, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a compiled word bank")
+        offset = HEADER.size
+        self.level_starts = list(LEVELS.unpack_from(view, offset))
+        offset += LEVELS.size
+
+        self.count = count
+        self.scores = view[offset:offset + 4 * count].cast('i')
+        offset += 4 * count
+        self._word_offsets = view[offset:offset + 4 * (count + 1)].cast('I')
+        offset += 4 * (count + 1)
+        self._gloss_offsets = view[offset:offset + 4 * (count + 1)].cast('I')
+        offset += 4 * (count + 1)
+        self._words = view[offset:offset + words_size]
+        offset += words_size + (-words_size % 4)
+        self._glosses = view[offset:offset + gloss_size]
+
+    def __len__(self):
+        return self.count
+
+    def level_range(self, level: int) -> Tuple[int, int]:
+        """[start, end) word indices of a difficulty level 1..5"""
+        return self.level_starts[level - 1], self.level_starts[level]
+
+    def word(self, idx: int) -> str:
+        return bytes(self._words[self._word_offsets[idx]:self._word_offsets[idx + 1]]).decode()
+
+    def score(self, idx: int) -> int:
+        return self.scores[idx]
+
+    def gloss(self, idx: int) -> str:
+        return bytes(self._glosses[self._gloss_offsets[idx]:self._gloss_offsets[idx + 1]]).decode()
+
+    def entry(self, idx: int) -> Tuple[str, int, str]:
+        return self.word(idx), self.score(idx), self.gloss(idx)
+
+    def words(self):
+        for idx in range(self.count):
+            yield self.word(idx)
+
+
+def ensure_word_bank(path: str = WORD_BANK_PATH, csv_path: str = WORD_BANK_CSV) -> bool:
+    """compile the word bank when it's missing or older than the csv, returns whether it did"""
+    if not os.path.exists(path) or (os.path.exists(csv_path) and os.path.getmtime(csv_path) > os.path.getmtime(path)):
+        compile_word_bank(csv_path, path)
+        return True
+    return False
+
+
+def load_word_bank(path: str = WORD_BANK_PATH, csv_path: str = WORD_BANK_CSV) -> WordBank:
+    """open the compiled word bank, (re)building it first when the csv is newer"""
+    ensure_word_bank(path, csv_path)
+    return WordBank(path)
+
+
+if __name__ == '__main__':
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else WORD_BANK_CSV
+    out_path = sys.argv[2] if len(sys.argv) > 2 else WORD_BANK_PATH
+    print(f"compiled {compile_word_bank(csv_path, out_path)} words into {out_path}")
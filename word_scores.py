@@ -0,0 +1,165 @@
+"""word difficulty scores and the word bank built from them.
+
+every word gets a score from five components, computed for the whole list at once with numpy:
+    rarity        how uncommon its letters are in english text (cryptanalysis letter frequencies)
+    scrabble      scrabble tile values
+    permutations  log of the number of distinct orderings of its letters, more to brute force
+    length
+    frequency     log of how often the word shows up in a corpus, common words are easier
+each component is standardised, weighted and the sum is spread over SCORE_RANGE. the words are written to
+word_score_gloss_sorted.csv in score order and compiled into word_bank.bin, with the level boundaries taken
+from word_bank.LEVEL_QUANTILES:
+
+    python word_scores.py words.txt --freq word_counts.tsv --gloss word_score_gloss_sorted.csv
+
+the word list is one word per line or a csv with a Word column. --freq lines are "word count" separated by a
+tab, comma or space. glosses (the level 5 hint) are taken from --gloss or from a Gloss column of the word list.
+"""
+import argparse
+import csv
+import re
+import time
+
+import numpy as np
+
+from word_bank import WORD_BANK_CSV, WORD_BANK_PATH, LEVEL_QUANTILES, compile_word_bank, level_boundaries
+
+LETTER_FREQUENCY = {
+    'e': 12.70, 't': 9.06, 'a': 8.17, 'o': 7.51, 'i': 6.97, 'n': 6.75, 's': 6.33, 'h': 6.09, 'r': 5.99,
+    'd': 4.25, 'l': 4.03, 'c': 2.78, 'u': 2.76, 'm': 2.41, 'w': 2.36, 'f': 2.23, 'g': 2.02, 'y': 1.97,
+    'p': 1.93, 'b': 1.49, 'v': 0.98, 'k': 0.77, 'j': 0.15, 'x': 0.15, 'q': 0.095, 'z': 0.074,
+}
+SCRABBLE = {
+    'a': 1, 'b': 3, 'c': 3, 'd': 2, 'e': 1, 'f': 4, 'g': 2, 'h': 4, 'i': 1, 'j': 8, 'k': 5, 'l': 1, 'm': 3,
+    'n': 1, 'o': 1, 'p': 3, 'q': 10, 'r': 1, 's': 1, 't': 1, 'u': 1, 'v': 4, 'w': 4, 'x': 8, 'y': 4, 'z': 10,
+}
+WEIGHTS = {"rarity": 1.0, "scrabble": 0.5, "permutations": 1.0, "length": 0.75, "frequency": -1.0}
+SCORE_RANGE = (100, 1000)  # base points of the easiest and hardest words
+
+WORD_RE = re.compile(r'^[a-z]+$')
+
+
+def _letter_table(values: dict) -> np.ndarray:
+    table = np.zeros(256)
+    for letter, value in values.items():
+        table[ord(letter)] = value
+    return table
+
+
+def encode(words) -> np.ndarray:
+    """n x longest word matrix of ascii codes, zero padded"""
+    longest = max(map(len, words))
+    return np.array(words, dtype=f'S{longest}').view(np.uint8).reshape(len(words), longest)
+
+
+def components(words, frequencies=None) -> dict:
+    """raw score components of every word, arrays in the order of words"""
+    codes = encode(words)
+    lengths = (codes != 0).sum(axis=1)
+
+    rarity_table = _letter_table({letter: -np.log(share / 100) for letter, share in LETTER_FREQUENCY.items()})
+    rarity = rarity_table[codes].sum(axis=1) / lengths
+    scrabble = _letter_table(SCRABBLE)[codes].sum(axis=1)
+
+    # distinct orderings n! / prod(count_c!), in logs
+    rows, cols = np.nonzero(codes)
+    counts = np.bincount(rows * 26 + (codes[rows, cols] - ord('a')), minlength=len(words) * 26).reshape(len(words), 26)
+    log_factorial = np.concatenate([[0.0], np.cumsum(np.log(np.arange(1, codes.shape[1] + 1)))])
+    permutations = log_factorial[lengths] - log_factorial[counts].sum(axis=1)
+
+    if frequencies:
+        frequency = np.log1p(np.fromiter((frequencies.get(word, 0) for word in words), dtype=np.float64, count=len(words)))
+    else:
+        frequency = np.zeros(len(words))
+    return {"rarity": rarity, "scrabble": scrabble, "permutations": permutations, "length": lengths.astype(np.float64),
+            "frequency": frequency}
+
+
+def score_words(words, frequencies=None, weights=WEIGHTS, score_range=SCORE_RANGE) -> np.ndarray:
+    parts = components(words, frequencies)
+    combined = np.zeros(len(words))
+    for name, weight in weights.items():
+        values = parts[name]
+        spread = values.std()
+        if spread:
+            combined += weight * (values - values.mean()) / spread
+    # the 1st and 99th percentile map to the ends of the range so a few odd words don't squash the rest
+    low, high = np.percentile(combined, [1, 99])
+    scaled = np.clip((combined - low) / ((high - low) or 1), 0, 1)
+    return np.rint(score_range[0] + scaled * (score_range[1] - score_range[0])).astype(np.int64)
+
+
+def read_words(path: str):
+    """(words, glosses) from a plain word list or a csv with Word and optionally Gloss columns"""
+    with open(path, 'r') as file:
+        first = file.readline()
+        file.seek(0)
+        if first.strip().startswith('Word'):
+            rows = list(csv.DictReader(file))
+            return [row['Word'].strip().lower() for row in rows], {row['Word'].strip().lower(): row.get('Gloss') or '' for row in rows}
+        return [line.strip().lower() for line in file if line.strip()], {}
+
+
+def read_frequencies(path: str) -> dict:
+    frequencies = {}
+    with open(path, 'r') as file:
+        for line in file:
+            parts = re.split(r'[\t, ]+', line.strip())
+            if len(parts) >= 2:
+                try:
+                    frequencies[parts[0].lower()] = frequencies.get(parts[0].lower(), 0) + float(parts[1])
+                except ValueError:
+                    continue # header line
+    return frequencies
+
+
+def write_scored_csv(path: str, words, scores, glosses):
+    """rows sorted by score, ties by word, the order the word bank levels are cut from"""
+    order = np.lexsort((np.array(words), scores))
+    with open(path, 'w', newline='') as out:
+        writer = csv.writer(out)
+        writer.writerow(['Word', 'Score', 'Gloss'])
+        for idx in order:
+            writer.writerow([words[idx], int(scores[idx]), glosses.get(words[idx], '')])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("words", help="word list, one per line or a csv with a Word column")
+    parser.add_argument("--freq", default=None, help="corpus counts, 'word count' per line")
+    parser.add_argument("--gloss", default=None, help="csv with Word and Gloss columns to take glosses from")
+    parser.add_argument("--csv", default=WORD_BANK_CSV, help="where to write the scored csv")
+    parser.add_argument("--bank", default=WORD_BANK_PATH, help="where to write the compiled word bank")
+    parser.add_argument("--quantiles", default=None, help="comma separated level start quantiles, default word_bank.LEVEL_QUANTILES")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    words, glosses = read_words(args.words)
+    if args.gloss:
+        glosses.update(read_words(args.gloss)[1])
+    kept = sorted({word for word in words if WORD_RE.match(word)})
+    if len(kept) < len(words):
+        print(f"skipped {len(words) - len(kept)} duplicate or non a-z words")
+    frequencies = read_frequencies(args.freq) if args.freq else None
+    loaded = time.perf_counter()
+
+    scores = score_words(kept, frequencies)
+    scored = time.perf_counter()
+
+    write_scored_csv(args.csv, kept, scores, glosses)
+    quantiles = tuple(float(q) for q in args.quantiles.split(',')) if args.quantiles else LEVEL_QUANTILES
+    count = compile_word_bank(args.csv, args.bank, quantiles)
+    done = time.perf_counter()
+
+    starts = level_boundaries(count, quantiles) + [count]
+    sorted_scores = np.sort(scores)
+    for level in range(1, 6):
+        first, end = starts[level - 1], starts[level]
+        span = f"scores {sorted_scores[first]}-{sorted_scores[end - 1]}" if end > first else "empty"
+        print(f"level {level}: words {first}-{end} ({end - first}), {span}")
+    print(f"{count} words into {args.csv} and {args.bank}: load {loaded - start:.2f}s, "
+          f"score {scored - loaded:.2f}s, write {done - scored:.2f}s")
+
+
+if __name__ == "__main__":
+    main()